@@ -0,0 +1,71 @@
+"""
+Benchmark the overhead of running code in a context.
+
+Measures the time of running a trivial and a printing snippet inline with
+PythonContext.run, through an executor with PythonContext.arun, and in a
+worker process with ProcessPythonContext.
+
+    python -m benchmarks.context --runs 2000
+"""
+
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from novagent.context import PythonContext, ProcessPythonContext, WorkerPool
+
+SNIPPETS = {
+    "pass": "pass",
+    "print": "for i in range(100):\n    print(i)",
+}
+
+
+def measure_run(context, code: str, runs: int) -> float:
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        context.run(code)
+
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+async def measure_arun(context, code: str, runs: int, executor) -> float:
+    outputs = []
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        await context.arun(code, executor, lambda index, text: outputs.append(text))
+
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    pool = WorkerPool(size=1)
+    process_context = ProcessPythonContext(pool)
+
+    try:
+        for name, code in SNIPPETS.items():
+            results = {
+                "run": measure_run(PythonContext(), code, args.runs),
+                "arun": asyncio.run(
+                    measure_arun(PythonContext(), code, args.runs, executor)
+                ),
+                "process": measure_run(process_context, code, args.runs),
+            }
+            print(
+                f"{name:>16}: "
+                + ", ".join(f"{k} {v:.1f} us" for k, v in results.items())
+            )
+    finally:
+        process_context.close()
+        pool.close()
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
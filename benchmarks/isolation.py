@@ -0,0 +1,121 @@
+"""
+Stress the output capture of contexts running in parallel.
+
+Dozens of contexts print a token of their own from the threads of a pool,
+through `run` and through `arun` with streamed output. Every execution
+must get back its own output, nothing else, and the process streams must
+only get what is written outside of the executions. Exits with an error
+when output crossed sessions.
+
+    python -m benchmarks.isolation --contexts 64 --workers 16
+"""
+
+import io
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from novagent.context import PythonContext
+
+CODE = """
+import sys
+for i in range({lines}):
+    print("{token}", i)
+    print("{token}", i, file=sys.stderr)
+    if i % 10 == 0:
+        sum(range(1000))
+"""
+
+
+def expected(token: str, lines: int) -> str:
+    return "\n".join(f"{token} {i}" for i in range(lines))
+
+
+def check_run(index: int, lines: int) -> list[str]:
+    token = f"context-{index}"
+    out, err = PythonContext().run(CODE.format(token=token, lines=lines))
+    want = expected(token, lines)
+
+    return [
+        f"{token}: {name} mismatch"
+        for name, got in [("stdout", out), ("stderr", err)]
+        if got != want
+    ]
+
+
+async def check_arun(index: int, lines: int, executor) -> list[str]:
+    token = f"context-{index}"
+    streamed = ["", ""]
+
+    def on_output(stream: int, text: str):
+        streamed[stream] += text
+
+    out, err = await PythonContext().arun(
+        CODE.format(token=token, lines=lines), executor, on_output
+    )
+    want = expected(token, lines)
+    errors = []
+
+    for name, got in [("stdout", out), ("stderr", err)]:
+        if got != want:
+            errors.append(f"{token}: arun {name} mismatch")
+
+    for name, got in zip(["stdout", "stderr"], streamed):
+        if got.strip() != want:
+            errors.append(f"{token}: streamed {name} mismatch")
+
+    return errors
+
+
+async def check_all_arun(contexts: int, lines: int, executor) -> list[str]:
+    results = await asyncio.gather(
+        *(check_arun(i, lines, executor) for i in range(contexts))
+    )
+    return [error for errors in results for error in errors]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--contexts", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # the process streams must only get what is written outside of the code.
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+    streams = sys.stdout, sys.stderr
+    errors = []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for _ in range(args.rounds):
+            results = executor.map(
+                check_run, range(args.contexts), [args.lines] * args.contexts
+            )
+            errors += [error for errors in results for error in errors]
+            errors += asyncio.run(check_all_arun(args.contexts, args.lines, executor))
+
+    print("outside")
+    print("outside", file=sys.stderr)
+    sys.stdout, sys.stderr = stdout, stderr
+
+    for name, stream in zip(["stdout", "stderr"], streams):
+        if stream.getvalue() != "outside\n":
+            errors.append(f"the process {name} got other output")
+
+    executions = args.rounds * args.contexts * 2
+    elapsed = time.perf_counter() - start
+    print(f"{executions} executions in {elapsed:.2f}s, {len(errors)} errors")
+
+    for error in errors[:20]:
+        print(f"  {error}")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark the token latency of sessions while others run CPU heavy code.
+
+A probe session streams a long answer at a steady pace while N sessions
+run a CPU bound loop, for a few seconds. The delay between two chunks
+seen by the probe, past the pace of the model, is the latency added by
+the server: it stays flat when the code runs off the event loop.
+
+    python -m benchmarks.load --sessions 0 4 16 --work 500000
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+from novagent.config import NovagentConfig
+from novagent.models import ScriptedModel
+from novagent.session import MessageType
+
+BUSY = "Thought: compute.\n```py\nx = sum(i * i for i in range({work}))\n```"
+
+
+def probe_answer(chars: int) -> str:
+    thought = ("word " * (chars // 5))[:chars]
+    return f"Thought: {thought}\n```py\nfinal_answer(1)\n```"
+
+
+async def run_probe(
+    config: NovagentConfig, delay: float, duration: float
+) -> list[float]:
+    session = config.session()
+    messages = session.arun("Write a long answer.")
+    deadline = time.perf_counter() + duration
+    gaps = []
+    last = None
+
+    try:
+        async for message in messages:
+            if message.type != MessageType.AGENT:
+                continue
+
+            now = time.perf_counter()
+
+            if last is not None:
+                gaps.append(max(0.0, now - last - delay))
+
+            if now > deadline:
+                break
+
+            last = now
+    finally:
+        await messages.aclose()
+
+    return gaps
+
+
+async def run_busy(session):
+    # the busy model never answers, the session runs until cancelled.
+    async for _ in session.arun("Compute."):
+        pass
+
+
+async def measure(
+    probe: NovagentConfig,
+    busy: NovagentConfig,
+    sessions: int,
+    delay: float,
+    duration: float,
+) -> dict:
+    # the sessions are created ahead, a worker process may have to be spawned.
+    busy_sessions = [busy.session() for _ in range(sessions)]
+    workers = [asyncio.ensure_future(run_busy(session)) for session in busy_sessions]
+
+    # let the busy sessions reach their code.
+    await asyncio.sleep(0.2)
+
+    try:
+        gaps = await run_probe(probe, delay, duration)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        for session in busy_sessions:
+            session.context.close()
+
+    gaps.sort()
+
+    return {
+        "p50 ms": statistics.median(gaps) * 1e3,
+        "p99 ms": gaps[int(len(gaps) * 0.99)] * 1e3,
+        "max ms": gaps[-1] * 1e3,
+        "chunks": len(gaps),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="*", default=[0, 4, 16])
+    parser.add_argument("--work", type=int, default=500000)
+    parser.add_argument("--chars", type=int, default=100000)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.002)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    probe_model = ScriptedModel(
+        [probe_answer(args.chars)], chunk_size=args.chunk_size, delay=args.delay
+    )
+    busy_model = ScriptedModel([BUSY.format(work=args.work)] * 100000)
+    modes = {
+        "inline": {},
+        "threads": {"max_workers": args.workers},
+        "processes": {"processes": args.workers},
+    }
+
+    for name, options in modes.items():
+        probe = NovagentConfig(probe_model, max_workers=args.workers)
+        busy = NovagentConfig(busy_model, **options)
+
+        try:
+            for sessions in args.sessions:
+                result = asyncio.run(
+                    measure(probe, busy, sessions, args.delay, args.duration)
+                )
+                label = f"{name} {sessions}"
+                print(
+                    f"{label:>16}: "
+                    + ", ".join(f"{k} {v:.2f}" for k, v in result.items())
+                )
+        finally:
+            if busy.pool is not None:
+                busy.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark the per-call overhead of logging in LiteLLMModel.
+
+Streams a long completion from a fake provider through the model with no
+logger, with a streaming logger and with a plain logger, which needs the
+chunks kept and the response rebuilt. Reports the time per call and the
+peak memory allocated during a call.
+
+    python -m benchmarks.model_logging --tokens 4000 --calls 20
+"""
+
+import time
+import asyncio
+import argparse
+import warnings
+import tracemalloc
+from litellm.types.utils import ModelResponseStream
+from novagent import models
+from novagent.loggers import StreamingLogger
+from novagent.models import LiteLLMModel
+
+
+class CountingLogger(StreamingLogger):
+    def start(self, messages):
+        return [0]
+
+    def chunk(self, state, chunk):
+        state[0] += 1
+
+
+def plain_logger(messages, response):
+    pass
+
+
+def fake_completion(chunks: list[ModelResponseStream]):
+    async def acompletion(**kwargs):
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        return stream()
+
+    return acompletion
+
+
+async def consume(model: LiteLLMModel, messages: list[dict]):
+    async for _ in model(messages):
+        pass
+
+
+async def measure(model: LiteLLMModel, calls: int) -> dict:
+    messages = [{"role": "user", "content": "Count to a large number."}]
+
+    # warm up the lazy imports of litellm.
+    await consume(model, messages)
+
+    wall = time.perf_counter()
+    for _ in range(calls):
+        await consume(model, messages)
+    wall = time.perf_counter() - wall
+
+    tracemalloc.start()
+    await consume(model, messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ms/call": wall / calls * 1e3, "peak KiB": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=4000)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    # the serialization warnings of the rebuilt response are not of interest.
+    warnings.simplefilter("ignore")
+
+    chunks = [
+        ModelResponseStream(choices=[{"delta": {"content": f"tok{i} "}}])
+        for i in range(args.tokens)
+    ]
+    models.acompletion = fake_completion(chunks)
+
+    loggers = {
+        "no logger": None,
+        "streaming logger": CountingLogger(),
+        "plain logger": plain_logger,
+    }
+
+    for name, logger in loggers.items():
+        model = LiteLLMModel("openai/gpt-4o-mini", logger=logger, cache_control=False)
+        result = asyncio.run(measure(model, args.calls))
+        print(f"{name:>16}: " + ", ".join(f"{k} {v:.2f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
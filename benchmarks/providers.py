@@ -0,0 +1,202 @@
+"""
+Check the retry, timeout and fallback policy of LiteLLMModel.
+
+A fake OpenAI compatible server answers according to the requested model:
+`ok` streams a short answer, `slow` waits before its first chunk, `stall`
+waits after it, `fail` answers 503 and `bad` answers 400. Each scenario
+reports its time, the answer or the error raised, and the models called.
+Exits with an error when a scenario did not behave as expected.
+
+    python -m benchmarks.providers --port 8765
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import litellm
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from novagent.models import LiteLLMModel
+
+# seconds the slow models keep the client waiting.
+STALL = 3.0
+
+app = FastAPI()
+calls = []
+
+
+def chunk(model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    data = {
+        "id": "fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+    if usage is not None:
+        data["usage"] = usage
+
+    return f"data: {json.dumps(data)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def completions(request: Request):
+    model = (await request.json())["model"]
+    calls.append(model)
+
+    if model == "fail":
+        return JSONResponse({"error": {"message": "overloaded"}}, status_code=503)
+
+    if model == "bad":
+        return JSONResponse({"error": {"message": "bad request"}}, status_code=400)
+
+    async def stream():
+        if model == "slow":
+            await asyncio.sleep(STALL)
+
+        for index, text in enumerate(["Hello ", "from ", model]):
+            yield chunk(model, {"content": text})
+
+            if model == "stall" and index == 0:
+                await asyncio.sleep(STALL)
+
+        usage = {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8}
+        yield chunk(model, {}, "stop", usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def start(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    return server
+
+
+# name, model, options, expected answer or error, expected calls, time limit
+SCENARIOS = [
+    ("answer", "ok", {}, "Hello from ok", ["ok"], 1.0),
+    (
+        "slow first token",
+        "slow",
+        {"first_token_timeout": 0.5, "retries": 0, "fallbacks": ["openai/ok"]},
+        "Hello from ok",
+        ["slow", "ok"],
+        1.5,
+    ),
+    (
+        "503 then fallback",
+        "fail",
+        {"retries": 2, "backoff": 0.05, "fallbacks": ["openai/ok"]},
+        "Hello from ok",
+        ["fail", "fail", "fail", "ok"],
+        1.0,
+    ),
+    (
+        "503 without fallback",
+        "fail",
+        {"retries": 1, "backoff": 0.05},
+        "ServiceUnavailableError",
+        ["fail", "fail"],
+        1.0,
+    ),
+    (
+        "400 not retried",
+        "bad",
+        {"retries": 2, "fallbacks": ["openai/ok"]},
+        "BadRequestError",
+        ["bad"],
+        1.0,
+    ),
+    (
+        "read timeout",
+        "slow",
+        {"timeout": 0.5, "retries": 0, "fallbacks": ["openai/ok"]},
+        "Hello from ok",
+        ["slow", "ok"],
+        1.5,
+    ),
+    (
+        "read timeout mid-stream",
+        "stall",
+        {"timeout": 0.5, "retries": 2, "fallbacks": ["openai/ok"]},
+        "Timeout",
+        ["stall"],
+        1.5,
+    ),
+]
+
+
+async def run(model: LiteLLMModel) -> str:
+    messages = [{"role": "user", "content": "Hello"}]
+
+    try:
+        return "".join(
+            [
+                chunk.choices[0].delta.content or ""
+                async for chunk in model(messages)
+                if chunk.choices
+            ]
+        )
+    except Exception as e:
+        return type(e).__name__
+
+
+async def check(api_base: str) -> list[str]:
+    errors = []
+
+    for name, model_id, options, expected, expected_calls, limit in SCENARIOS:
+        model = LiteLLMModel(
+            f"openai/{model_id}", api_key="fake", api_base=api_base, **options
+        )
+        calls.clear()
+        start = time.perf_counter()
+        result = await run(model)
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:>24}: {elapsed:.2f}s, {result}, calls {calls}")
+
+        if result != expected:
+            errors.append(f"{name}: got {result!r}, expected {expected!r}")
+
+        if calls != expected_calls:
+            errors.append(f"{name}: called {calls}, expected {expected_calls}")
+
+        if elapsed > limit:
+            errors.append(f"{name}: took {elapsed:.2f}s, more than {limit}s")
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    # the expected errors are reported below, not with the LiteLLM help.
+    litellm.suppress_debug_info = True
+    server = start(args.port)
+
+    try:
+        errors = asyncio.run(check(f"http://127.0.0.1:{args.port}/v1"))
+    finally:
+        server.should_exit = True
+
+    for error in errors:
+        print(f"  {error}")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
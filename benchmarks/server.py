@@ -0,0 +1,75 @@
+"""
+Benchmark the /run endpoint end to end with a scripted model.
+
+Streams a long answer through the server app, in process, and measures
+the SSE frames and bytes per second with and without coalescing.
+
+    python -m benchmarks.server --chars 20000 --chunk-size 4
+"""
+
+import time
+import asyncio
+import argparse
+import httpx
+from novagent.config import NovagentConfig
+from novagent.models import ScriptedModel
+from novagent.server import create_server
+
+
+def answer(chars: int) -> str:
+    thought = ("word " * (chars // 5))[:chars]
+    return f"Thought: {thought}\n```py\nfinal_answer(1)\n```"
+
+
+async def measure(model: ScriptedModel, coalesce: float | None, runs: int) -> dict:
+    app = create_server(NovagentConfig(model), coalesce=coalesce)
+    transport = httpx.ASGITransport(app=app)
+
+    frames = 0
+    size = 0
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        for _ in range(runs):
+            response = await client.post("/session")
+            headers = {"X-Session-ID": response.json()["session_id"]}
+            response = await client.post("/run", json={"task": "go"}, headers=headers)
+            frames += response.text.count("data: ")
+            size += len(response.content)
+
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+    return {
+        "frames/run": frames / runs,
+        "frames/sec": frames / wall,
+        "MB/sec": size / wall / 1e6,
+        "cpu ms/run": cpu / runs * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chars", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--windows", type=float, nargs="*", default=[0.01])
+    args = parser.parse_args()
+
+    model = ScriptedModel(
+        [answer(args.chars)], chunk_size=args.chunk_size, delay=args.delay
+    )
+
+    for window in [None, *args.windows]:
+        result = asyncio.run(measure(model, window, args.runs))
+        name = f"coalesce {window}s" if window else "per chunk"
+        print(f"{name:>16}: " + ", ".join(f"{k} {v:.2f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark NovagentSession.arun against a scripted model.
+
+Measures the overhead of a step (model stream, parsing, code execution and
+bookkeeping) with an instant model, then the scaling of concurrent sessions
+with a model streaming at a realistic pace.
+
+    python -m benchmarks.session --steps 200 --sessions 1 10 100
+"""
+
+import time
+import asyncio
+import argparse
+from novagent.config import NovagentConfig
+from novagent.models import ScriptedModel
+
+STEP = "Thought: compute the next value.\n```py\nx = sum(range(100))\nprint(x)\n```"
+FINAL = "Thought: done.\n```py\nfinal_answer(x)\n```"
+
+
+def script(steps: int) -> list[str]:
+    return [STEP] * (steps - 1) + [FINAL]
+
+
+async def run_session(config: NovagentConfig) -> int:
+    session = config.session()
+
+    async for _ in session.arun("Compute the sum."):
+        pass
+
+    return session.nstep
+
+
+async def step_overhead(steps: int, max_workers: int | None) -> dict:
+    model = ScriptedModel(script(steps), chunk_size=16)
+    config = NovagentConfig(model, max_workers=max_workers)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    nsteps = await run_session(config)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    return {
+        "steps": nsteps,
+        "us/step": wall / nsteps * 1e6,
+        "cpu us/step": cpu / nsteps * 1e6,
+    }
+
+
+async def concurrent_sessions(
+    sessions: int, steps: int, delay: float, chunk_size: int
+) -> dict:
+    model = ScriptedModel(script(steps), chunk_size=chunk_size, delay=delay)
+    config = NovagentConfig(model, max_workers=8)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    nsteps = sum(await asyncio.gather(*(run_session(config) for _ in range(sessions))))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    return {"steps/sec": nsteps / wall, "cpu %": cpu / wall * 100, "wall s": wall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--sessions", type=int, nargs="*", default=[1, 10, 100])
+    parser.add_argument("--session-steps", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.01)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    args = parser.parse_args()
+
+    for max_workers in [None, 4]:
+        result = asyncio.run(step_overhead(args.steps, max_workers))
+        name = f"{max_workers} workers" if max_workers else "inline"
+        print(f"{name:>16}: " + ", ".join(f"{k} {v:.2f}" for k, v in result.items()))
+
+    for sessions in args.sessions:
+        result = asyncio.run(
+            concurrent_sessions(
+                sessions, args.session_steps, args.delay, args.chunk_size
+            )
+        )
+        name = f"{sessions} sessions"
+        print(f"{name:>16}: " + ", ".join(f"{k} {v:.2f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark the SSE encoding of a long token stream.
+
+Measures frames/sec and CPU time per streamed token with and without the
+coalescing mode of the server, for a stream of one-token AGENT chunks
+arriving every `--interval` seconds.
+
+    python -m benchmarks.sse --tokens 4000 --interval 0.0005
+"""
+
+import time
+import asyncio
+import argparse
+from novagent.session import Message, MessageType
+from novagent.server import coalesce_messages, sse
+
+
+async def token_stream(tokens: int, interval: float):
+    for i in range(tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        yield Message(MessageType.AGENT, 1, f"tok{i} ")
+
+
+async def measure(tokens: int, interval: float, window: float | None) -> dict:
+    messages = token_stream(tokens, interval)
+
+    if window:
+        messages = coalesce_messages(messages, window)
+
+    frames = 0
+    size = 0
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    async for message in messages:
+        frame = sse({"type": message.type.name, "content": message.content})
+        frames += 1
+        size += len(frame)
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    return {
+        "frames": frames,
+        "bytes": size,
+        "frames/sec": frames / wall,
+        "cpu us/token": cpu / tokens * 1e6,
+        "wall s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=4000)
+    parser.add_argument("--interval", type=float, default=0.0005)
+    parser.add_argument("--windows", type=float, nargs="*", default=[0.01, 0.05])
+    args = parser.parse_args()
+
+    for window in [None, *args.windows]:
+        result = asyncio.run(measure(args.tokens, args.interval, window))
+        name = f"coalesce {window}s" if window else "per chunk"
+        print(f"{name:>16}: " + ", ".join(f"{k} {v:.2f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
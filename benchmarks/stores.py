@@ -0,0 +1,161 @@
+"""
+Check and time the round trip of a session state through the stores.
+
+A session runs a step, its state is saved to the store, loaded back into
+a new session which must go on with the same history, token counts and
+variables. Deleted and expired states must be gone. The Redis store runs
+against FakeRedis, an in-memory stand-in of `redis.asyncio.Redis`.
+Exits with an error when a store lost something.
+
+    python -m benchmarks.stores --runs 200
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from novagent.config import NovagentConfig
+from novagent.models import ScriptedModel
+from novagent.session import MessageType
+from novagent.stores import MemorySessionStore, RedisSessionStore, SQLiteSessionStore
+
+STEP = "Thought: keep a value.\n```py\nx = 41\nprint(x)\n```"
+FINAL = "Thought: done.\n```py\nfinal_answer(x + 1)\n```"
+
+KEYS = ["version", "messages", "nstep", "prompt_tokens", "completion_tokens"]
+
+
+class FakeRedis:
+    """
+    The get/set/delete methods of `redis.asyncio.Redis`, kept in memory.
+
+    Values are returned as bytes and expire after `ex` seconds, which must
+    be a positive integer like for Redis.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, name: str) -> bytes | None:
+        value, expires = self.data.get(name, (None, None))
+
+        if expires is not None and expires <= time.monotonic():
+            del self.data[name]
+            return None
+
+        return value
+
+    async def set(self, name: str, value: str | bytes | int, ex: int | None = None):
+        if ex is not None and (not isinstance(ex, int) or ex <= 0):
+            raise ValueError("ex must be a positive integer")
+
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+
+        expires = time.monotonic() + ex if ex is not None else None
+        self.data[name] = (value, expires)
+
+        return True
+
+    async def delete(self, *names: str) -> int:
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+
+async def run(session, task: str) -> list:
+    return [
+        message.content
+        async for message in session.arun(task)
+        if message.type == MessageType.FINAL
+    ]
+
+
+async def check(name: str, store, config: NovagentConfig, runs: int) -> list[str]:
+    errors = []
+    session = config.session()
+    await run(session, "Keep a value.")
+    session.version = 3
+    state = await asyncio.to_thread(session.state)
+
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        await store.set(session.id, state)
+        loaded = await store.get(session.id)
+
+    elapsed = (time.perf_counter() - start) / runs
+
+    if loaded is None:
+        return [f"{name}: the state was not found"]
+
+    for key in KEYS:
+        if loaded[key] != state[key]:
+            errors.append(f"{name}: {key} changed on the way")
+
+    # workers check their cached sessions against it.
+    if await store.version(session.id) != state["version"]:
+        errors.append(f"{name}: the version does not match the state")
+
+    # the variables come back with the state, the session goes on.
+    restored = config.session(session.id)
+    await asyncio.to_thread(restored.load_state, loaded)
+
+    if await run(restored, "Finish.") != [42]:
+        errors.append(f"{name}: the restored session lost its variables")
+
+    await store.delete(session.id)
+
+    if await store.get(session.id) is not None:
+        errors.append(f"{name}: the deleted state is still there")
+
+    print(f"{name:>8}: {elapsed * 1e3:.3f} ms per set and get")
+
+    return errors
+
+
+async def check_expiry(name: str, store) -> list[str]:
+    await store.set("expiring", {"nstep": 1})
+    await asyncio.sleep(1.1)
+
+    if await store.get("expiring") is not None:
+        return [f"{name}: the state did not expire"]
+
+    return []
+
+
+async def check_all(runs: int, directory: Path) -> list[str]:
+    model = ScriptedModel([STEP, FINAL, FINAL])
+    config = NovagentConfig(model)
+    errors = []
+
+    stores = {
+        "memory": lambda ttl: MemorySessionStore(ttl=ttl),
+        "sqlite": lambda ttl: SQLiteSessionStore(directory / f"{ttl}.db", ttl=ttl),
+        "redis": lambda ttl: RedisSessionStore(FakeRedis(), ttl=ttl),
+    }
+
+    for name, factory in stores.items():
+        errors += await check(name, factory(1500), config, runs)
+        errors += await check_expiry(name, factory(1))
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        errors = asyncio.run(check_all(args.runs, Path(directory)))
+
+    for error in errors:
+        print(f"  {error}")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterator
+
+
+class SessionBusyError(Exception):
+    """The session is already running a task."""
+
+
+class QueueFullError(Exception):
+    """Too many runs are already waiting for a slot."""
+
+
+class AdmissionController:
+    """
+    Limit the number of concurrent runs, the others wait in a FIFO queue.
+
+    A session can only run one task at a time and new runs are rejected once
+    the queue is full, so under load latency degrades gracefully instead of
+    every run slowing down at once.
+
+    Args:
+        max_concurrent (int): Maximum number of concurrent runs (default: unlimited)
+        max_queue (int): Maximum number of runs waiting for a slot (default: 100)
+    """
+
+    def __init__(self, max_concurrent: int | None = None, max_queue: int = 100):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters = deque()
+        self.sessions = set()
+
+    def admit(self, session_id: str) -> "Ticket":
+        """
+        Register a run of the session, raise when it can not be accepted.
+
+        The slot or the place in the queue is taken right away, so a burst
+        of requests is limited before their runs start.
+        """
+        if session_id in self.sessions:
+            raise SessionBusyError(f"Session {session_id} is already running a task")
+
+        ticket = Ticket(self, session_id)
+
+        if not self.waiters and self._has_slot():
+            ticket.admitted = True
+            self.active += 1
+        elif len(self.waiters) >= self.max_queue:
+            raise QueueFullError("Too many tasks are waiting, retry later")
+        else:
+            self.waiters.append(ticket)
+
+        self.sessions.add(session_id)
+
+        return ticket
+
+    def _has_slot(self) -> bool:
+        return self.max_concurrent is None or self.active < self.max_concurrent
+
+    def _dispatch(self):
+        while self.waiters and self._has_slot():
+            ticket = self.waiters.popleft()
+            ticket.admitted = True
+            self.active += 1
+            ticket.event.set()
+
+        # the remaining waiters moved forward in the queue.
+        for ticket in self.waiters:
+            ticket.event.set()
+
+
+class Ticket:
+    """
+    An accepted run, holding a slot or a place in the queue until released.
+
+    Leaving `wait` before the slot is granted gives the place back.
+    """
+
+    def __init__(self, controller: AdmissionController, session_id: str):
+        self.controller = controller
+        self.session_id = session_id
+        self.event = asyncio.Event()
+        self.admitted = False
+        self.released = False
+
+    async def wait(self) -> AsyncIterator[int]:
+        """Wait for a slot, yielding the position in the queue when it changes."""
+        controller = self.controller
+        position = None
+
+        try:
+            while not self.admitted:
+                self.event.clear()
+
+                current = controller.waiters.index(self) + 1
+
+                if current != position:
+                    position = current
+                    yield position
+
+                if not self.admitted:
+                    await self.event.wait()
+        finally:
+            if not self.admitted:
+                self.release()
+
+    def release(self):
+        if self.released:
+            return
+
+        self.released = True
+        controller = self.controller
+        controller.sessions.discard(self.session_id)
+
+        if self.admitted:
+            controller.active -= 1
+            controller._dispatch()
+        elif self in controller.waiters:
+            controller.waiters.remove(self)
+            controller._dispatch()
+
+
+class RateLimiter:
+    """
+    Pace the requests sent to a model provider under its per minute quotas.
+
+    Both quotas are token buckets refilled continuously and holding up to a
+    second of quota, so the requests are spread instead of sent in bursts.
+    The tokens of a request are only known once it is over: they are charged
+    afterwards and the next requests wait until the debt is paid back.
+
+    Args:
+        requests_per_minute (float): Maximum requests per minute (default: unlimited)
+        tokens_per_minute (float): Maximum tokens per minute (default: unlimited)
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ):
+        self.buckets = {
+            name: _Bucket(rate / 60)
+            for name, rate in [
+                ("requests", requests_per_minute),
+                ("tokens", tokens_per_minute),
+            ]
+            if rate
+        }
+        # the waiting requests are served in order.
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request can be sent."""
+        async with self.lock:
+            if "requests" in self.buckets:
+                await self.buckets["requests"].take(1)
+
+            if "tokens" in self.buckets:
+                await self.buckets["tokens"].take(0)
+
+    def charge(self, tokens: int):
+        """Count the tokens used by a request."""
+        if "tokens" in self.buckets:
+            self.buckets["tokens"].charge(tokens)
+
+
+class _Bucket:
+    def __init__(self, rate: float):
+        self.rate = rate  # per second
+        self.capacity = max(rate, 1)
+        self.level = self.capacity
+        self.updated = None
+
+    def _refill(self):
+        now = asyncio.get_running_loop().time()
+
+        if self.updated is not None:
+            elapsed = now - self.updated
+            self.level = min(self.capacity, self.level + elapsed * self.rate)
+
+        self.updated = now
+
+    async def take(self, amount: float):
+        """Wait until the level is above `amount`, then take it."""
+        self._refill()
+
+        while self.level < amount:
+            await asyncio.sleep((amount - self.level) / self.rate)
+            self._refill()
+
+        self.level -= amount
+
+    def charge(self, amount: float):
+        self._refill()
+        self.level -= amount
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+
+class ResponseCache:
+    """
+    On-disk cache of model responses, stored as their stream of chunks.
+
+    Entries are keyed by a hash of the model id, the messages and the stop
+    sequence, so replaying the same history replays the same response with
+    the original chunk boundaries. Reading an entry refreshes it and the
+    least recently used entries are evicted past the limits.
+
+    Args:
+        path (str | Path): Directory holding the entries
+        max_entries (int): Maximum number of entries (default: 1000)
+        max_bytes (int): Maximum total size of the entries in bytes (default: unlimited)
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int | None = 1000,
+        max_bytes: int | None = None,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def key(self, model_id: str, messages: list[dict], stop: str | None) -> str:
+        data = json.dumps([model_id, messages, stop], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> list[dict] | None:
+        path = self._entry(key)
+
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f]
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return chunks
+
+    def set(self, key: str, chunks: list[dict]):
+        path = self._entry(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+        with tmp.open("w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk) + "\n")
+
+        # concurrent readers see either no entry or a complete one.
+        os.replace(tmp, path)
+
+        self._evict()
+
+    def clear(self):
+        for path in self.path.glob("*.jsonl"):
+            path.unlink(missing_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.path / f"{key}.jsonl"
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+
+            for path in self.path.glob("*.jsonl"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            entries.sort()
+
+            count = len(entries)
+            size = sum(entry[1] for entry in entries)
+
+            for _, entry_size, path in entries:
+                if (self.max_entries is None or count <= self.max_entries) and (
+                    self.max_bytes is None or size <= self.max_bytes
+                ):
+                    break
+
+                path.unlink(missing_ok=True)
+                count -= 1
+                size -= entry_size
@@ -1,7 +1,9 @@
 from typing import Callable, Any
-from novagent.context import PythonContext
+from concurrent.futures import ThreadPoolExecutor
+from novagent.context import PythonContext, ProcessPythonContext, WorkerPool
 from novagent.session import NovagentSession
-from novagent.runners import DummyRunner, StdoutRunner, CliRunner
+from novagent.runners import DummyRunner, StdoutRunner, CliRunner, BatchRunner
+from novagent.tools import Tool
 from novagent.system_prompt import default_system_prompt_template
 
 
@@ -14,6 +16,7 @@ class NovagentConfig:
         "json",
         "csv",
         "datetime",
+        "asyncio",
     ]
 
     def __init__(
@@ -23,24 +26,89 @@ class NovagentConfig:
         authorized_imports: list[str] = [],
         extra_instructions: str | None = None,
         system_prompt_template: Callable[[list[str], list[str], list[str]], str] = None,
+        max_workers: int | None = None,
+        context_factory: Callable[[], PythonContext] | None = None,
+        history_factory: Callable[[], Callable[[list[dict]], Any]] | None = None,
+        logger=None,
+        profile_feedback: float | None = None,
+        tools: list[Callable | Tool] = [],
+        processes: int | None = None,
     ):
         self.model = model
-        self.context = context or PythonContext()
+
+        # functions are wrapped as tools without cache nor limit.
+        self.tools = {}
+
+        for function in tools:
+            tool = function if isinstance(function, Tool) else Tool(function)
+            self.tools[tool.name] = tool
+
+        tool_descriptions = [tool.describe() for tool in self.tools.values()]
+
+        # logger of the session events (profiles), the model has its own.
+        self.logger = logger
+        self.profile_feedback = profile_feedback
 
         self.authorized_imports = (
             authorized_imports or NovagentConfig.DEFAULT_AUTHORIZED_IMPORTS
         )
 
+        # every session gets its own context, either from the factory or by
+        # forking the template context with its preloaded variables.
+        self.context = context or PythonContext()
+        self.context_factory = context_factory or self.context.fork
+        self.pool = None
+
+        # or its own worker process, out of the GIL of the server, taken from
+        # a pool keeping `processes` of them started ahead.
+        if processes:
+            if context is not None or context_factory is not None:
+                raise ValueError("processes can not be used with a context")
+
+            if self.tools:
+                raise ValueError("processes can not be used with tools")
+
+            self.pool = WorkerPool(
+                size=processes, authorized_imports=self.authorized_imports
+            )
+            self.context_factory = lambda: ProcessPythonContext(self.pool)
+
+        # history strategies may hold a per-session state, one is built per session.
+        self.history_factory = history_factory
+
+        # bounded pool shared by all the sessions so running code does not
+        # block the event loop. Code runs inline when it is not set.
+        self.executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="novagent")
+            if max_workers
+            else None
+        )
+
         self.system_prompt = (
-            system_prompt_template(self.authorized_imports, [], [])
+            system_prompt_template(self.authorized_imports, tool_descriptions, [])
             if system_prompt_template
             else default_system_prompt_template(
-                extra_instructions, self.authorized_imports, [], []
+                extra_instructions, self.authorized_imports, tool_descriptions, []
             )
         )
 
-    def session(self):
-        return NovagentSession(self.model, self.context, self.system_prompt)
+    def session(self, session_id: str | None = None):
+        context = self.context_factory()
+
+        # the tools are shared by the sessions, so are their caches and limits.
+        if self.tools:
+            context.inject(self.tools)
+
+        return NovagentSession(
+            self.model,
+            context,
+            self.system_prompt,
+            self.executor,
+            self.history_factory() if self.history_factory else None,
+            session_id,
+            self.logger,
+            self.profile_feedback,
+        )
 
     def dummy(self):
         return DummyRunner(self.session())
@@ -50,3 +118,7 @@ class NovagentConfig:
 
     def cli(self):
         return CliRunner(self.session())
+
+    def batch(self, **kwargs):
+        """A runner of many tasks, each in a new session, see BatchRunner."""
+        return BatchRunner(self.session, **kwargs)
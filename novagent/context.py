@@ -1,13 +1,427 @@
 import io
+import os
 import sys
+import ast
+import copy
+import ctypes
+import signal
+import zlib
+import time
+import types
+import inspect
+import pickle
+import asyncio
+import weakref
+import contextvars
+import importlib
+import threading
+import tracemalloc
+import multiprocessing
+from collections import deque, Counter
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from concurrent.futures import Executor
+
+# buffers (stdout, stderr) of the execution running in the current thread or task.
+_capture = contextvars.ContextVar("capture", default=None)
+_install_lock = threading.Lock()
+
+# tracemalloc is process wide, a single profiled execution measures memory.
+_tracemalloc_lock = threading.Lock()
+
+
+class _RoutedStream:
+    """
+    Replacement of sys.stdout or sys.stderr installed once for the process.
+
+    Writes go to the buffer of the execution running in the current thread,
+    or to the original stream outside of any execution. Concurrent contexts
+    never see each other output and the server keeps its own.
+    """
+
+    def __init__(self, stream, index: int):
+        self.stream = stream
+        self.index = index
+
+    def write(self, text: str) -> int:
+        buffers = _capture.get()
+
+        if buffers is None:
+            return self.stream.write(text)
+
+        return buffers[self.index].write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if _capture.get() is None:
+            self.stream.flush()
+
+    def isatty(self) -> bool:
+        return _capture.get() is None and self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _install_capture():
+    with _install_lock:
+        if not isinstance(sys.stdout, _RoutedStream):
+            sys.stdout = _RoutedStream(sys.stdout, 0)
+        if not isinstance(sys.stderr, _RoutedStream):
+            sys.stderr = _RoutedStream(sys.stderr, 1)
+
+
+class _CappedBuffer:
+    """
+    Text buffer bounded to `limit` characters.
+
+    Past the limit only the head and the tail of the output are kept and the
+    value summarizes how many characters were dropped in between.
+    """
+
+    def __init__(self, limit: int | None = None, on_write=None):
+        self.limit = limit
+        self.on_write = on_write
+        self.head = io.StringIO()
+        self.head_room = limit // 2 if limit is not None else None
+        self.tail = deque()
+        self.tail_size = 0
+        self.dropped = 0
+
+    def write(self, text: str) -> int:
+        size = len(text)
+
+        if self.head_room is None:
+            self._write_head(text)
+            return size
+
+        if self.head_room > 0:
+            self._write_head(text[: self.head_room])
+            text = text[self.head_room :]
+            self.head_room = max(0, self.head_room - size)
+
+        if text:
+            self.tail.append(text)
+            self.tail_size += len(text)
+
+        # drop the oldest tail chunks until the tail fits again.
+        overflow = self.tail_size - (self.limit - self.limit // 2)
+
+        while overflow > 0:
+            chunk = self.tail.popleft()
+
+            if len(chunk) > overflow:
+                self.tail.appendleft(chunk[overflow:])
+                chunk = chunk[:overflow]
+
+            self.tail_size -= len(chunk)
+            self.dropped += len(chunk)
+            overflow -= len(chunk)
+
+        return size
+
+    def getvalue(self) -> str:
+        return self.head.getvalue() + self.rest()
+
+    def rest(self) -> str:
+        """The value past the head, which is not forwarded as it is written."""
+        tail = "".join(self.tail)
+
+        if not self.dropped:
+            return tail
+
+        return f"\n... [{self.dropped} characters truncated] ...\n{tail}"
+
+    def _write_head(self, text: str):
+        self.head.write(text)
+
+        if self.on_write is not None and text:
+            self.on_write(text)
+
+
+class _OutputBridge:
+    """
+    Forward the output written by the executing thread to the event loop.
+
+    Consecutive writes are coalesced until the loop picks them up, and the
+    writer blocks while more than `max_pending` characters are waiting, so
+    a chatty execution can not outrun the consumer. An async `on_output` is
+    awaited before the next output is forwarded: writing to a bounded queue
+    makes the writer wait for the reader of the queue.
+    """
+
+    def __init__(self, on_output, max_pending: int = 65536):
+        self.loop = asyncio.get_running_loop()
+        self.on_output = on_output
+        self.is_async = inspect.iscoroutinefunction(on_output)
+        self.max_pending = max_pending
+        self.pending = []
+        self.pending_size = 0
+        self.scheduled = False
+        self.closed = False
+        self.delivery = None
+        self.condition = threading.Condition()
+
+    async def run(self, executor: Executor | None, function, code) -> tuple[str, str]:
+        """Run `function(code, on_output)` in the executor, forwarding its output."""
+        try:
+            result = await self.loop.run_in_executor(
+                executor, function, code, self.write
+            )
+
+            # the last output may still be on its way to the consumer.
+            if self.delivery is not None:
+                await asyncio.shield(self.delivery)
+
+            return result
+        finally:
+            self.close()
+
+    def write(self, index: int, text: str):
+        with self.condition:
+            if self.closed:
+                return
+
+            if self.pending and self.pending[-1][0] == index:
+                self.pending[-1][1].append(text)
+            else:
+                self.pending.append((index, [text]))
+
+            self.pending_size += len(text)
+
+            if not self.scheduled:
+                self.scheduled = True
+                self.loop.call_soon_threadsafe(self._flush)
+
+            while (
+                self.pending_size > self.max_pending
+                and not self.closed
+                and not self.loop.is_closed()
+            ):
+                self.condition.wait(timeout=1)
+
+    def close(self):
+        """Stop forwarding, the consumer is gone: the writer is not held anymore."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        if self.delivery is not None:
+            self.delivery.cancel()
+
+    def _flush(self):
+        if self.is_async:
+            if self.delivery is None or self.delivery.done():
+                self.delivery = self.loop.create_task(self._deliver())
+            return
+
+        for index, text in self._take():
+            self.on_output(index, text)
+            self._done(len(text))
+
+    async def _deliver(self):
+        while outputs := self._take():
+            for index, text in outputs:
+                await self.on_output(index, text)
+                self._done(len(text))
+
+    def _take(self) -> list[tuple[int, str]]:
+        with self.condition:
+            pending = self.pending
+            self.pending = []
+            self.scheduled = bool(pending) and self.is_async
+
+        return [(index, "".join(texts)) for index, texts in pending]
+
+    def _done(self, size: int):
+        with self.condition:
+            self.pending_size -= size
+            self.condition.notify_all()
+
+
+class _Profiler:
+    """
+    Sample the stack of the thread running an execution, and trace its memory.
+
+    cProfile hooks every thread of the process since python 3.12, so the
+    executing thread is sampled instead: concurrent executions each get
+    their own profile. Only the frames called from `_exec` are counted.
+
+    With `trace_memory` the peak memory is measured with tracemalloc, which
+    slows allocation heavy code down a lot. It is the peak of the process,
+    only measured when no other execution is tracing memory.
+    """
+
+    INTERVAL = 0.005  # seconds between two samples
+    TOP = 10  # number of hot functions reported
+
+    def __init__(self, thread_id: int, trace_memory: bool = False):
+        self.thread_id = thread_id
+        self.trace_memory = trace_memory
+        self.own = Counter()  # samples with the function running
+        self.total = Counter()  # samples with the function on the stack
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self.traced = self.trace_memory and _tracemalloc_lock.acquire(blocking=False)
+
+        if self.traced:
+            self.was_tracing = tracemalloc.is_tracing()
+
+            if not self.was_tracing:
+                tracemalloc.start()
+
+            tracemalloc.reset_peak()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self) -> dict:
+        self.stopped.set()
+        self.sampler.join()
+
+        duration = time.perf_counter() - self.started
+        peak_memory = None
+
+        if self.traced:
+            peak_memory = max(0, tracemalloc.get_traced_memory()[1] - self.baseline)
+
+            if not self.was_tracing:
+                tracemalloc.stop()
+
+            _tracemalloc_lock.release()
+
+        scale = duration / self.samples if self.samples else 0.0
+
+        return {
+            "duration": duration,
+            "samples": self.samples,
+            "peak_memory": peak_memory,
+            "functions": [
+                {
+                    "function": function,
+                    "self": count * scale,
+                    "total": self.total[function] * scale,
+                }
+                for function, count in self.own.most_common(self.TOP)
+            ],
+        }
+
+    def _sample(self):
+        while not self.stopped.wait(self.INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while (
+                frame is not None and frame.f_code is not PythonContext._exec.__code__
+            ):
+                code = frame.f_code
+
+                # the agent code is reported by line, the rest by function.
+                if code.co_filename == "<string>":
+                    stack.append(f"{code.co_name} (line {frame.f_lineno})")
+                else:
+                    stack.append(
+                        f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                    )
+
+                frame = frame.f_back
+
+            # the execution has not started or is already over.
+            if frame is None or not stack:
+                continue
+
+            self.samples += 1
+            self.own[stack[0]] += 1
+            self.total.update(set(stack))
+
+
+def format_profile(profile: dict) -> str:
+    """Summarize a profile for the model, with a hint to speed the code up."""
+    summary = f"Profile: the code ran for {profile['duration']:.2f}s"
+
+    if profile["peak_memory"] is not None:
+        summary += f", peak memory {profile['peak_memory'] / 1e6:.1f} MB"
+
+    lines = [f"{summary}."]
+
+    if profile["functions"]:
+        lines.append("Hot spots (own time, total time):")
+
+        for function in profile["functions"][:5]:
+            lines.append(
+                f"- {function['function']}: "
+                f"{function['self']:.2f}s, {function['total']:.2f}s"
+            )
+
+    lines.append(
+        "Hint: if this step is slow, speed up the hot spots, e.g. vectorize "
+        "python loops with numpy or pandas and avoid repeating expensive work."
+    )
+
+    return "\n".join(lines)
+
+
+class ExecutionInterrupted(BaseException):
+    """
+    Raised asynchronously in the thread running the agent code to stop it.
+
+    It is not an Exception so the agent code can not swallow it with a bare
+    `except Exception`.
+    """
 
 
 class PythonContext:
-    def __init__(self):
+    """
+    A python context executing the agent code in the server process.
+
+    The code may use `await` at the top level, it then runs on an event loop
+    of the context so its coroutines can wait concurrently. The tasks still
+    pending at the end of an execution are cancelled.
+
+    Args:
+        timeout (float): Wall-clock limit of one execution in seconds. The
+            code is interrupted between two bytecodes, so a long call into C
+            only stops when it returns.
+        max_output (int): Maximum number of characters kept per stream, the
+            rest is summarized by its head and its tail.
+        profile (bool): Profile the executions, the result of the last one
+            is kept in `last_profile`.
+        trace_memory (bool): Add the peak memory to the profiles, measured
+            with tracemalloc which slows allocation heavy code down a lot.
+    """
+
+    # objects with more items are shared with the forks instead of copied.
+    FORK_COPY_LIMIT = 10000
+
+    def __init__(
+        self,
+        timeout: float | None = None,
+        max_output: int | None = None,
+        profile: bool = False,
+        trace_memory: bool = False,
+    ):
         self.globals = {}
         self.globals["final_answer"] = self._final_answer
         self.has_final_answer = False
         self.final_answer_value = None
+        self.timeout = timeout
+        self.max_output = max_output
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.last_profile = None
+        self.interrupt_lock = threading.Lock()
+        self.thread_id = None
+        self.interrupt_reason = None
+        self.loop = None  # created by the first code awaiting
+        self.injected = {}  # variables provided by the host, see inject
+        self.shared = set()  # variables the forks share instead of copying
 
     def clear_final_answer(self):
         self.has_final_answer = False
@@ -17,18 +431,753 @@ class PythonContext:
         self.has_final_answer = True
         self.final_answer_value = value
 
-    def run(self, code) -> tuple[str, str]:
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        sys.stdout = sys_out = io.StringIO()
-        sys.stderr = sys_err = io.StringIO()
+    def fork(self, shared: set[str] | None = None) -> "PythonContext":
+        """
+        Create a new context starting from the globals of this one.
+
+        The variables are deep copied, so a fork mutating an object in place
+        does not alter the template nor the other forks, and the functions
+        defined in the template use the globals of the fork. Large objects,
+        of more than FORK_COPY_LIMIT items, are shared instead: datasets
+        loaded in a template are not copied for every session, the forks
+        must not mutate them. So are the variables named in `shared` (default:
+        the `shared` attribute), modules, injected variables and the objects
+        which can not be copied (open files, locks, ...).
+        """
+        context = PythonContext(
+            self.timeout, self.max_output, self.profile, self.trace_memory
+        )
+        shared = self.shared if shared is None else set(shared)
+
+        # objects reachable from several variables stay a single one.
+        memo = {}
+
+        for name, value in self.globals.items():
+            if (
+                name in shared
+                or isinstance(value, types.ModuleType)
+                or self.injected.get(name) is value
+            ):
+                memo[id(value)] = value
+            elif isinstance(value, types.FunctionType):
+                memo[id(value)] = self._rebind(value, context.globals)
+            elif not self._is_small(value):
+                memo[id(value)] = value
+            elif isinstance(value, (dict, list, tuple, set)):
+                # large objects held by a small container are shared too.
+                items = value.values() if isinstance(value, dict) else value
+
+                for item in items:
+                    if not self._is_small(item):
+                        memo[id(item)] = item
+
+        for name, value in self.globals.items():
+            # the fork gets its own final_answer and builtins.
+            if name in ("final_answer", "__builtins__"):
+                continue
+
+            try:
+                context.globals[name] = copy.deepcopy(value, memo)
+            except Exception:
+                context.globals[name] = value
+
+        context.injected = dict(self.injected)
+        context.shared = set(shared)
+
+        return context
 
+    def _is_small(self, value) -> bool:
         try:
-            exec(code, self.globals)
+            return len(value) <= self.FORK_COPY_LIMIT
+        except Exception:
+            return True
+
+    def _rebind(self, function: types.FunctionType, globals: dict):
+        """A copy of a function defined in this context, using other globals."""
+        if function.__globals__ is not self.globals:
+            return function
+
+        rebound = types.FunctionType(
+            function.__code__,
+            globals,
+            function.__name__,
+            function.__defaults__,
+            function.__closure__,
+        )
+        rebound.__kwdefaults__ = function.__kwdefaults__
+        rebound.__qualname__ = function.__qualname__
+        rebound.__dict__.update(function.__dict__)
+
+        return rebound
+
+    def inject(self, variables: dict):
+        """
+        Define variables provided by the host, such as the tools.
+
+        They are left out of the snapshots: the host defines them again in
+        the context the snapshot is restored to.
+        """
+        self.globals.update(variables)
+        self.injected.update(variables)
+
+    def snapshot(self) -> tuple[bytes, list[str]]:
+        """
+        Serialize the variables to a compressed pickle.
+
+        Modules are saved by name and imported again on restore. Variables
+        which can not be pickled (open files, functions defined by the agent
+        code, ...) are skipped and their names returned with the data.
+        """
+        modules = {}
+        variables = {}
+
+        for name, value in self.globals.items():
+            if name in ("final_answer", "__builtins__"):
+                continue
+
+            if name in self.injected and self.injected[name] is value:
+                continue
+
+            if isinstance(value, types.ModuleType):
+                modules[name] = value.__name__
+            else:
+                variables[name] = value
+
+        skipped = []
+
+        # pickle the variables together to keep the objects they share.
+        try:
+            data = pickle.dumps((modules, variables), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            for name, value in list(variables.items()):
+                try:
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    skipped.append(name)
+                    del variables[name]
+
+            data = pickle.dumps((modules, variables), pickle.HIGHEST_PROTOCOL)
+
+        return zlib.compress(data), skipped
+
+    def restore(self, data: bytes) -> list[str]:
+        """
+        Load the variables of a snapshot, return the names which failed.
+
+        Restoring unpickles the data: only restore snapshots from a trusted
+        source.
+        """
+        modules, variables = pickle.loads(zlib.decompress(data))
+
+        skipped = []
+
+        for name, module in modules.items():
+            try:
+                self.globals[name] = importlib.import_module(module)
+            except ImportError:
+                skipped.append(name)
+
+        self.globals.update(variables)
+
+        return skipped
+
+    def run(self, code, on_output=None) -> tuple[str, str]:
+        """
+        Run the code and return its (stdout, stderr).
+
+        When given, `on_output(index, text)` receives the output as it is
+        written, index being 0 for stdout and 1 for stderr. Together the
+        chunks add up to the returned values, except for the stripping.
+        """
+        _install_capture()
+
+        self.last_profile = None
+
+        sys_out = _CappedBuffer(
+            self.max_output, on_output and (lambda text: on_output(0, text))
+        )
+        sys_err = _CappedBuffer(
+            self.max_output, on_output and (lambda text: on_output(1, text))
+        )
+        token = _capture.set((sys_out, sys_err))
+
+        timer = None
+
+        if self.timeout is not None:
+            reason = f"Execution timed out after {self.timeout} seconds"
+            timer = threading.Timer(self.timeout, self.interrupt, (reason,))
+            timer.start()
+
+        profiler = None
+
+        if self.profile:
+            profiler = _Profiler(threading.get_ident(), self.trace_memory)
+            profiler.start()
+
+        # errors are reported after the captured output so the cap never hides them.
+        errors = []
+
+        try:
+            self._exec(code)
+        except ExecutionInterrupted:
+            self._leave()
+            errors.append(f"Error during execution: {self.interrupt_reason}")
         except Exception as e:
-            print(f"Error during execution: {e}", file=sys.stderr)
+            errors.append(f"Error during execution: {str(e) or type(e).__name__}")
         finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+            self._cancel_tasks()
+            _capture.reset(token)
+
+            if timer is not None:
+                timer.cancel()
+
+            if profiler is not None:
+                self.last_profile = profiler.stop()
+
+        if sys_out.dropped or sys_err.dropped:
+            dropped = sys_out.dropped + sys_err.dropped
+            errors.append(f"Output truncated: {dropped} characters omitted")
+
+        err = "\n".join([sys_err.getvalue().strip(), *errors]).strip()
+
+        if on_output is not None:
+            rest_out = sys_out.rest()
+            rest_err = sys_err.rest()
+
+            if errors:
+                written = sys_err.getvalue()
+                separator = "\n" if written and not written.endswith("\n") else ""
+                rest_err += separator + "\n".join(errors)
+
+            if rest_out:
+                on_output(0, rest_out)
+
+            if rest_err:
+                on_output(1, rest_err)
+
+        return sys_out.getvalue().strip(), err
+
+    def interrupt(self, reason: str = "Execution interrupted") -> bool:
+        """Stop the running execution, return whether one was running."""
+        with self.interrupt_lock:
+            if self.thread_id is None or self.interrupt_reason is not None:
+                return False
+
+            self.interrupt_reason = reason
+
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(self.thread_id), ctypes.py_object(ExecutionInterrupted)
+            )
+
+            # the exception is only raised once the loop wakes up from its wait.
+            if self.loop is not None and self.loop.is_running():
+                self.loop.call_soon_threadsafe(lambda: None)
+
+            return True
+
+    def _exec(self, code):
+        compiled = compile(
+            code, "<string>", "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+        )
+
+        with self.interrupt_lock:
+            self.thread_id = threading.get_ident()
+            self.interrupt_reason = None
+
+        try:
+            # with a top level await, evaluating the code returns a coroutine.
+            if compiled.co_flags & inspect.CO_COROUTINE:
+                self._run_coroutine(eval(compiled, self.globals))
+            else:
+                exec(compiled, self.globals)
+        finally:
+            self._leave()
+
+    def _run_coroutine(self, coroutine):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+
+        self._run_until_complete(coroutine)
+
+    def _cancel_tasks(self, timeout: float = 1.0):
+        """Cancel the tasks left by the execution and wait for them a moment."""
+        if self.loop is None:
+            return
+
+        tasks = asyncio.all_tasks(self.loop)
+
+        if tasks:
+            for task in tasks:
+                task.cancel()
+
+            self._run_until_complete(asyncio.wait(tasks, timeout=timeout))
+
+    def _run_until_complete(self, awaitable):
+        # without executor the code runs in the thread of the session loop,
+        # which is set aside meanwhile: it is blocked anyway.
+        running = asyncio._get_running_loop()
+        asyncio._set_running_loop(None)
+
+        try:
+            return self.loop.run_until_complete(awaitable)
+        finally:
+            asyncio._set_running_loop(running)
+
+    def _leave(self):
+        with self.interrupt_lock:
+            if self.thread_id is None:
+                return
+
+            # the interruption may have been requested but not raised yet.
+            if self.interrupt_reason is not None:
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self.thread_id), None
+                )
+
+            self.thread_id = None
+
+    async def arun(
+        self, code, executor: Executor | None = None, on_output=None
+    ) -> tuple[str, str]:
+        """Run the code in the executor so the event loop is not blocked meanwhile.
+
+        Without executor the code runs inline, blocking the loop like `run`.
+        `on_output` may be a coroutine function, the output is then forwarded
+        once the previous one was awaited and the code waits when it is too
+        far ahead.
+        """
+        if executor is None and not inspect.iscoroutinefunction(on_output):
+            return self.run(code, on_output)
+
+        if executor is None:
+            # the loop is blocked anyway, the output is awaited once it ends.
+            outputs = []
+            result = self.run(code, lambda *output: outputs.append(output))
+
+            for index, text in outputs:
+                await on_output(index, text)
+
+            return result
+
+        if on_output is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, self.run, code
+            )
+
+        return await _OutputBridge(on_output).run(executor, self.run, code)
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.close()
+
+
+def _worker_main(conn, authorized_imports: list[str], max_memory: int | None):
+    """Entry point of a worker process: serve commands sent over the pipe."""
+
+    # allocations past the limit raise a MemoryError in the agent code.
+    if max_memory is not None:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+    # preload the authorized imports so the first step does not pay for them.
+    for name in authorized_imports:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    context = PythonContext()
+
+    # SIGINT interrupts the running code. The handler may run while the context
+    # holds its lock, so the interruption is requested from another thread.
+    signal.signal(
+        signal.SIGINT,
+        lambda *_: threading.Thread(target=context.interrupt).start(),
+    )
+
+    # until then an interruption would kill the worker, see WorkerPool._spawn.
+    conn.send(("ready", None))
+    _serve(conn, context)
+
+
+def _serve(conn, context: PythonContext):
+    forked = set()
+
+    while True:
+        try:
+            command, payload = conn.recv()
+        except EOFError:
+            break
+
+        # reap the exited forks, only them as the agent code may own processes too.
+        for pid in list(forked):
+            if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                forked.discard(pid)
+
+        if command == "run":
+            code, context.timeout, context.max_output = payload[:3]
+            context.profile, context.trace_memory = payload[3:]
+            context.clear_final_answer()
+            out, err = context.run(
+                code, lambda index, text: conn.send(("output", index, text))
+            )
+            value = context.final_answer_value
+
+            try:
+                pickle.dumps(value)
+            except Exception:
+                value = str(value)
+
+            conn.send(
+                (
+                    "result",
+                    out,
+                    err,
+                    context.has_final_answer,
+                    value,
+                    context.last_profile,
+                )
+            )
+        elif command == "fork":
+            fd = reduction.recv_handle(conn)
+            pid = os.fork()
+
+            if pid == 0:
+                # the child shares the parent memory pages until they are written.
+                conn.close()
+
+                # the selector of the loop is shared with the parent, not its tasks.
+                context.loop = None
+                _serve(Connection(fd), context)
+                os._exit(0)
+
+            os.close(fd)
+            forked.add(pid)
+            conn.send(pid)
+        elif command == "snapshot":
+            conn.send(context.snapshot())
+        elif command == "restore":
+            conn.send(context.restore(payload))
+        elif command == "close":
+            break
+
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, conn, process=None, pid: int | None = None):
+        self.conn = conn
+        self.process = process
+        self.pid = process.pid if process else pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def fork(self, mp) -> "_Worker":
+        """Fork the worker process, the child starts with a copy of its globals."""
+        parent_conn, child_conn = mp.Pipe()
+
+        try:
+            self.conn.send(("fork", None))
+            reduction.send_handle(self.conn, child_conn.fileno(), self.pid)
+            pid = self.conn.recv()
+        finally:
+            child_conn.close()
+
+        return _Worker(parent_conn, pid=pid)
+
+    def kill(self):
+        try:
+            if self.process is not None:
+                self.process.kill()
+                self.process.join()
+            else:
+                os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(("close", None))
+        except OSError:
+            pass
+
+        if self.process is not None:
+            self.process.join(timeout=1)
+
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        elif not self.conn.poll(1):
+            # forks are reaped by their parent worker, just make sure it exits.
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    A pool of worker processes spawned ahead of demand.
+
+    Workers are started with the authorized imports already loaded, so a
+    ProcessPythonContext only has to pick an idle one. The pool is refilled
+    in the background each time a worker is acquired.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        authorized_imports: list[str] = [],
+        start_method: str = "spawn",
+        max_memory: int | None = None,
+    ):
+        self.size = size
+        self.authorized_imports = list(authorized_imports)
+        self.max_memory = max_memory
+        self.mp = multiprocessing.get_context(start_method)
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.filling = False
+        self._fill()
+
+    def acquire(self) -> _Worker:
+        """Take a warm worker, spawning one only when the pool is empty."""
+        worker = None
+
+        with self.lock:
+            while self.idle and worker is None:
+                worker = self.idle.popleft()
+                if not worker.is_alive():
+                    worker = None
+
+        if worker is None:
+            worker = self._spawn()
+
+        self._refill()
+
+        return worker
+
+    def close(self):
+        with self.lock:
+            workers = list(self.idle)
+            self.idle.clear()
+
+        for worker in workers:
+            worker.close()
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self.mp.Pipe()
+        process = self.mp.Process(
+            target=_worker_main,
+            args=(child_conn, self.authorized_imports, self.max_memory),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        # the worker is only handed out once it handles SIGINT.
+        try:
+            parent_conn.recv()
+        except EOFError:
+            raise RuntimeError("The worker process failed to start") from None
+
+        return _Worker(parent_conn, process)
+
+    def _refill(self):
+        with self.lock:
+            if self.filling or len(self.idle) >= self.size:
+                return
+            self.filling = True
+
+        threading.Thread(target=self._fill, daemon=True).start()
+
+    def _fill(self):
+        try:
+            while True:
+                with self.lock:
+                    if len(self.idle) >= self.size:
+                        break
+
+                # e.g. killed at exit, acquire spawns its own and reports the error.
+                try:
+                    worker = self._spawn()
+                except RuntimeError:
+                    break
+
+                with self.lock:
+                    self.idle.append(worker)
+        finally:
+            with self.lock:
+                self.filling = False
+
+
+class ProcessPythonContext:
+    """
+    A python context whose globals live in a long-lived worker process.
+
+    The code runs outside of the server process: it does not share its GIL,
+    scales on multiple cores and a crash only loses this context state.
+
+    The timeout is first enforced inside the worker, keeping the variables.
+    When the code does not give control back within KILL_GRACE more seconds
+    the worker is killed. Memory is capped by the pool `max_memory`. With
+    `profile` set, the profile is taken in the worker, see PythonContext.
+    """
+
+    KILL_GRACE = 5
+
+    CRASH_ERROR = (
+        "Error during execution: the worker process crashed, all variables were lost"
+    )
+
+    KILL_ERROR = (
+        "Error during execution: timed out after {} seconds, "
+        "the worker process was killed and all variables were lost"
+    )
+
+    def __init__(
+        self,
+        pool: WorkerPool | None = None,
+        worker: _Worker | None = None,
+        timeout: float | None = None,
+        max_output: int | None = None,
+        profile: bool = False,
+        trace_memory: bool = False,
+    ):
+        self.pool = pool or WorkerPool(size=0)
+        self.timeout = timeout
+        self.max_output = max_output
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.last_profile = None
+        self.has_final_answer = False
+        self.final_answer_value = None
+        self.lock = threading.Lock()
+        self._attach(worker or self.pool.acquire())
+
+    def fork(self) -> "ProcessPythonContext":
+        """
+        Create a new context by forking the worker process.
+
+        The fork gets the globals of this context copy-on-write: preloaded
+        datasets are neither reloaded nor copied until one side writes them.
+        """
+        with self.lock:
+            worker = self.worker.fork(self.pool.mp)
+
+        return ProcessPythonContext(
+            self.pool,
+            worker,
+            self.timeout,
+            self.max_output,
+            self.profile,
+            self.trace_memory,
+        )
+
+    def clear_final_answer(self):
+        self.has_final_answer = False
+        self.final_answer_value = None
+
+    def inject(self, variables: dict):
+        # tools would run in the worker, apart from their cache and limits.
+        raise TypeError("Variables can not be injected in a worker process")
+
+    def run(self, code, on_output=None) -> tuple[str, str]:
+        """Run the code in the worker, see PythonContext.run."""
+        deadline = None
+        self.last_profile = None
+
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout + self.KILL_GRACE
+
+        with self.lock:
+            try:
+                options = (
+                    self.timeout,
+                    self.max_output,
+                    self.profile,
+                    self.trace_memory,
+                )
+                self.worker.conn.send(("run", (code, *options)))
+
+                while True:
+                    if deadline is not None and not self.worker.conn.poll(
+                        max(0, deadline - time.monotonic())
+                    ):
+                        self._replace(kill=True)
+                        return "", self.KILL_ERROR.format(self.timeout)
+
+                    message = self.worker.conn.recv()
+
+                    if message[0] == "result":
+                        break
+
+                    if on_output is not None:
+                        on_output(message[1], message[2])
+
+                _, out, err, has_final_answer, value, self.last_profile = message
+            except (EOFError, OSError):
+                # the worker died with the context state, start over with a new one.
+                self._replace()
+                return "", self.CRASH_ERROR
+
+        if has_final_answer:
+            self.has_final_answer = True
+            self.final_answer_value = value
+
+        return out, err
+
+    def interrupt(self, reason: str = "Execution interrupted") -> bool:
+        """Stop the code running in the worker, the variables are kept."""
+        try:
+            os.kill(self.worker.pid, signal.SIGINT)
+        except ProcessLookupError:
+            return False
+
+        return True
+
+    async def arun(
+        self, code, executor: Executor | None = None, on_output=None
+    ) -> tuple[str, str]:
+        """Wait for the worker in the executor (or the loop default one)."""
+        if on_output is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, self.run, code
+            )
+
+        return await _OutputBridge(on_output).run(executor, self.run, code)
+
+    def snapshot(self) -> tuple[bytes, list[str]]:
+        """Serialize the variables of the worker, see PythonContext.snapshot."""
+        with self.lock:
+            self.worker.conn.send(("snapshot", None))
+            return self.worker.conn.recv()
+
+    def restore(self, data: bytes) -> list[str]:
+        """Load a snapshot in the worker, see PythonContext.restore."""
+        with self.lock:
+            self.worker.conn.send(("restore", data))
+            return self.worker.conn.recv()
+
+    def close(self):
+        self._finalizer()
+
+    def _replace(self, kill: bool = False):
+        self._finalizer.detach()
+
+        if kill:
+            self.worker.kill()
+        else:
+            self.worker.close()
+
+        self._attach(self.pool.acquire())
 
-        return sys_out.getvalue().strip(), sys_err.getvalue().strip()
+    def _attach(self, worker: _Worker):
+        self.worker = worker
+        self._finalizer = weakref.finalize(self, worker.close)
@@ -0,0 +1,187 @@
+from typing import Callable, Any
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough token count of the messages, about 4 characters per token."""
+    return sum(4 + len(message["content"]) // 4 for message in messages)
+
+
+class FullHistory:
+    """Send the whole history to the model, this is the default."""
+
+    def count(self, messages: list[dict]) -> int:
+        return estimate_tokens(messages)
+
+    async def __call__(self, messages: list[dict]) -> list[dict]:
+        return messages
+
+
+class SlidingWindowHistory:
+    """
+    Keep the system prompt and the most recent messages fitting the budget.
+
+    Args:
+        max_tokens (int): Token budget of the prompt
+        token_counter (Callable): Count the tokens of a message list (default: estimate)
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        token_counter: Callable[[list[dict]], int] = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.count = token_counter
+
+    async def __call__(self, messages: list[dict]) -> list[dict]:
+        if self.count(messages) <= self.max_tokens:
+            return messages
+
+        system, rest = messages[:1], messages[1:]
+
+        # drop the oldest messages, always keeping the last one.
+        while len(rest) > 1 and self.count(system + rest) > self.max_tokens:
+            rest = rest[1:]
+
+        # the conversation must start with a user message.
+        while len(rest) > 1 and rest[0]["role"] != "user":
+            rest = rest[1:]
+
+        return system + rest
+
+
+class TruncatedObservationsHistory:
+    """
+    Shorten the oldest observations until the prompt fits the budget.
+
+    Observations are usually the largest messages and the model rarely needs
+    the old ones verbatim, so only their head is kept. The last `keep_last`
+    messages are never truncated.
+
+    Args:
+        max_tokens (int): Token budget of the prompt
+        max_chars (int): Characters kept from a truncated observation (default: 200)
+        keep_last (int): Number of recent messages left untouched (default: 2)
+        token_counter (Callable): Count the tokens of a message list (default: estimate)
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        max_chars: int = 200,
+        keep_last: int = 2,
+        token_counter: Callable[[list[dict]], int] = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.max_chars = max_chars
+        self.keep_last = keep_last
+        self.count = token_counter
+
+    async def __call__(self, messages: list[dict]) -> list[dict]:
+        if self.count(messages) <= self.max_tokens:
+            return messages
+
+        messages = list(messages)
+
+        for i in range(1, max(1, len(messages) - self.keep_last)):
+            message = messages[i]
+
+            if message["role"] != "user" or not message["content"].startswith(
+                "Observation:"
+            ):
+                continue
+
+            content = message["content"]
+
+            if len(content) > self.max_chars:
+                dropped = len(content) - self.max_chars
+                content = (
+                    f"{content[: self.max_chars]}\n... [{dropped} characters truncated]"
+                )
+                messages[i] = {**message, "content": content}
+
+                if self.count(messages) <= self.max_tokens:
+                    break
+
+        return messages
+
+
+class SummarizedHistory:
+    """
+    Replace the early steps with a summary written by the model.
+
+    When the prompt exceeds the budget, every message but the system prompt
+    and the last `keep_last` ones is summarized in a single user message.
+    The summary is kept and extended on the next overflow, so the model is
+    only called when the budget is exceeded. Holds state: use one per session.
+
+    Args:
+        model (Callable): The model writing the summaries
+        max_tokens (int): Token budget of the prompt
+        keep_last (int): Number of recent messages never summarized (default: 4)
+        token_counter (Callable): Count the tokens of a message list (default: estimate)
+    """
+
+    PROMPT = (
+        "Summarize the conversation above for yourself: the task, what was tried, "
+        "the variables defined and their content, and the intermediate results. "
+        "Be concise and do not write any code."
+    )
+
+    def __init__(
+        self,
+        model: Callable[[list[dict]], Any],
+        max_tokens: int,
+        keep_last: int = 4,
+        token_counter: Callable[[list[dict]], int] = estimate_tokens,
+    ):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.keep_last = keep_last
+        self.count = token_counter
+        self.summary = None
+        self.summarized = 1  # number of messages covered by the summary
+
+    async def __call__(self, messages: list[dict]) -> list[dict]:
+        compacted = self._compact(messages)
+
+        if self.count(compacted) <= self.max_tokens:
+            return compacted
+
+        end = len(messages) - max(1, self.keep_last)
+
+        # the summary is a user message, the model answer comes next.
+        while end > self.summarized and messages[end]["role"] != "assistant":
+            end -= 1
+
+        if end <= self.summarized:
+            return compacted
+
+        self.summary = await self._summarize(self._compact(messages[:end]))
+        self.summarized = end
+
+        return self._compact(messages)
+
+    def _compact(self, messages: list[dict]) -> list[dict]:
+        if self.summary is None:
+            return messages
+
+        summary = {
+            "role": "user",
+            "content": f"Summary of the previous steps:\n{self.summary}",
+        }
+
+        return [messages[0], summary, *messages[self.summarized :]]
+
+    async def _summarize(self, messages: list[dict]) -> str:
+        request = [*messages, {"role": "user", "content": self.PROMPT}]
+
+        contents = []
+
+        async for chunk in self.model(request):
+            content = chunk.choices[0].delta.content
+
+            if content:
+                contents.append(content)
+
+        return "".join(contents).strip()
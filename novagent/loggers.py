@@ -1,16 +1,100 @@
 import json
+import time
+import atexit
+import logging
+import threading
+from queue import SimpleQueue, Empty
 from pathlib import Path
+from collections import OrderedDict
+from contextvars import ContextVar
 from datetime import datetime, timezone
+from typing import Any
+from litellm.types.utils import ModelResponseStream
+
+log = logging.getLogger(__name__)
+
+# id of the session calling the model, set by the session for its task.
+current_session_id: ContextVar[str | None] = ContextVar(
+    "current_session_id", default=None
+)
 
 
 class DummyLogger:
     def __call__(self, messages: list[dict], response: dict) -> None:
         pass
 
+    def event(self, name: str, data: dict) -> None:
+        pass
+
+
+class StreamingLogger:
+    """
+    Base of the loggers receiving the chunks of the responses as they arrive.
+
+    Unlike a plain logger, called with the complete response, the model
+    neither keeps the chunks nor rebuilds the response for it. `start` is
+    called before the stream and returns the state of the call, given back
+    to `chunk` for each chunk and to `end` once the stream is over or left.
+    """
+
+    def start(self, messages: list[dict]) -> Any:
+        return None
+
+    def chunk(self, state: Any, chunk: ModelResponseStream) -> None:
+        pass
+
+    def end(self, state: Any, complete: bool) -> None:
+        pass
+
+    def event(self, name: str, data: dict) -> None:
+        pass
+
 
 class JsonLineLogger:
+    """
+    Log the model calls as JSON lines, written by a background thread.
+
+    Calls only queue the entry: the writer thread serializes and appends
+    them in batches, every `flush_interval` seconds or once `max_batch`
+    entries are pending, so logging never blocks the event loop.
+
+    In delta mode an entry only holds the messages added since the previous
+    call of the same session, after the first `offset` messages of that
+    previous call. A prompt which is not an extension of the previous one
+    (rewritten by a history strategy) is logged in full with an offset of 0.
+
+    The file is rotated once it exceeds `max_bytes` or is older than
+    `max_age` seconds, keeping `backups` old files named `<path>.1`, ...
+
+    An entry which can not be serialized, or a batch which can not be
+    written, is reported with the `logging` module and counted in `dropped`:
+    the writer thread keeps going.
+
+    Args:
+        path (str | Path): The log file
+        overwrite (bool): Delete the existing log file (default: False)
+        timezone (tzinfo): Timezone of the timestamps (default: UTC)
+        delta (bool): Only log the new messages of each call (default: False)
+        max_bytes (int): Rotate the file past this size (default: never)
+        max_age (float): Rotate the file after this many seconds (default: never)
+        backups (int): Number of rotated files kept (default: 5)
+        flush_interval (float): Maximum delay before an entry is written (default: 1)
+        max_batch (int): Number of pending entries triggering a write (default: 1000)
+    """
+
+    MAX_SESSIONS = 10000  # sessions tracked by the delta mode
+
     def __init__(
-        self, path: str | Path, overwrite: bool = False, timezone=timezone.utc
+        self,
+        path: str | Path,
+        overwrite: bool = False,
+        timezone=timezone.utc,
+        delta: bool = False,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+        backups: int = 5,
+        flush_interval: float = 1.0,
+        max_batch: int = 1000,
     ):
         self.path = Path(path)
         self.path.parent.mkdir(parents=True, exist_ok=True)
@@ -18,12 +102,184 @@ class JsonLineLogger:
             self.path.unlink()  # delete the existing log file
 
         self.timezone = timezone
+        self.delta = delta
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.opened_at = time.time()
+        self.sessions = OrderedDict()  # session id -> (message count, last message)
+        self.dropped = 0  # entries lost to a serialization or write error
+        self.queue = SimpleQueue()
+        self.closed = False
+        self.thread = threading.Thread(
+            target=self._write_loop, name="novagent-logger", daemon=True
+        )
+        self.thread.start()
+
+        # the pending entries are written before the interpreter exits.
+        atexit.register(self.close)
 
     def __call__(self, messages: list[dict], response: dict):
-        entry = {
-            "timestamp": datetime.now(self.timezone).isoformat(),
-            "messages": messages,
-            "response": response,
-        }
+        entry = {"timestamp": datetime.now(self.timezone).isoformat()}
+
+        if self.delta:
+            session_id = current_session_id.get()
+            offset = self._offset(session_id, messages)
+            entry["session_id"] = session_id
+            entry["offset"] = offset
+            entry["messages"] = messages[offset:]
+        else:
+            # copied as the session keeps appending to its list.
+            entry["messages"] = list(messages)
+
+        entry["response"] = response
+
+        self.queue.put(entry)
+
+    def event(self, name: str, data: dict):
+        """Log an event of the session, such as the profile of a step."""
+        self.queue.put(
+            {
+                "timestamp": datetime.now(self.timezone).isoformat(),
+                "session_id": current_session_id.get(),
+                "event": name,
+                "data": data,
+            }
+        )
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until the entries logged so far are written, return whether so."""
+        if self.closed:
+            return True
+
+        done = threading.Event()
+        self.queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        # the writer thread is checked on so a dead one can not block forever.
+        while not done.wait(0.1):
+            if not self.thread.is_alive():
+                return False
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+        return True
+
+    def close(self):
+        """Write the pending entries and stop the writer thread."""
+        if self.closed:
+            return
+
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def _offset(self, session_id: str | None, messages: list[dict]) -> int:
+        """Number of messages of the previous call still at the start of this one."""
+        count, last = self.sessions.pop(session_id, (0, None))
+
+        if count > len(messages) or (count and messages[count - 1] is not last):
+            count = 0
+
+        self.sessions[session_id] = (len(messages), messages[-1] if messages else None)
+
+        if len(self.sessions) > self.MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+
+        return count
+
+    def _write_loop(self):
+        running = True
+
+        while running:
+            batch = []
+            waiters = []
+
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except Empty:
+                continue
+
+            # take what is pending, up to a batch.
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+                if len(batch) >= self.max_batch:
+                    break
+
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                self.dropped += len(batch)
+                log.exception("Could not write %d entries to %s", len(batch), self.path)
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+
+    def _write(self, batch: list[dict]):
+        lines = []
+
+        for entry in batch:
+            try:
+                lines.append(json.dumps(entry) + "\n")
+            except Exception:
+                self.dropped += 1
+                log.exception("Could not serialize an entry of %s", self.path)
+
+        data = "".join(lines)
+
+        if not data:
+            return
+
+        if self._should_rotate(len(data)):
+            self._rotate()
+
         with self.path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(entry) + "\n")
+            f.write(data)
+
+    def _should_rotate(self, size: int) -> bool:
+        if self.max_age is not None and time.time() - self.opened_at >= self.max_age:
+            return True
+
+        if self.max_bytes is None:
+            return False
+
+        try:
+            current = self.path.stat().st_size
+        except FileNotFoundError:
+            return False
+
+        return current > 0 and current + size > self.max_bytes
+
+    def _rotate(self):
+        self.opened_at = time.time()
+
+        if not self.path.exists():
+            return
+
+        if self.backups <= 0:
+            self.path.unlink()
+            return
+
+        for i in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+
+        self.path.replace(self.path.with_name(f"{self.path.name}.1"))
@@ -0,0 +1,96 @@
+import bisect
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+RATE_BUCKETS = [5, 10, 20, 40, 60, 80, 100, 150, 200, 400]
+SIZE_BUCKETS = [100, 500, 1000, 2000, 5000, 10000, 50000, 100000]
+
+
+class Histogram:
+    """A cumulative histogram, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, buckets: list[float]):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+
+        if index < len(self.buckets):
+            self.counts[index] += 1
+
+        self.count += 1
+        self.sum += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+
+        return lines
+
+
+class StepMetrics:
+    """Aggregate the timings of the steps, as attached to their INFO message."""
+
+    def __init__(self):
+        self.histograms = {
+            "ttft": Histogram(
+                "novagent_step_ttft_seconds",
+                "Time to the first token of the model answer",
+                LATENCY_BUCKETS,
+            ),
+            "generation": Histogram(
+                "novagent_step_generation_seconds",
+                "Time from the first token to the end of the code block",
+                LATENCY_BUCKETS,
+            ),
+            "tokens_per_sec": Histogram(
+                "novagent_step_tokens_per_second",
+                "Generation speed of the model",
+                RATE_BUCKETS,
+            ),
+            "execution": Histogram(
+                "novagent_step_execution_seconds",
+                "Time running the code of the step",
+                LATENCY_BUCKETS,
+            ),
+            "observation_chars": Histogram(
+                "novagent_step_observation_chars",
+                "Size of the observation sent back to the model",
+                SIZE_BUCKETS,
+            ),
+        }
+
+    def observe(self, timings: dict):
+        for key, histogram in self.histograms.items():
+            value = timings.get(key)
+
+            if value is not None:
+                histogram.observe(value)
+
+    def render(self, gauges: dict[str, tuple[str, float]] = {}) -> str:
+        """The Prometheus text exposition, with the gauges as name: (help, value)."""
+        lines = []
+
+        for name, (help, value) in gauges.items():
+            lines += [
+                f"# HELP {name} {help}",
+                f"# TYPE {name} gauge",
+                f"{name} {value}",
+            ]
+
+        for histogram in self.histograms.values():
+            lines += histogram.render()
+
+        return "\n".join(lines) + "\n"
@@ -1,40 +1,425 @@
+import json
+import random
+import asyncio
+import inspect
+import litellm
+from pathlib import Path
 from typing import Callable
-from litellm import acompletion, stream_chunk_builder
-from novagent.loggers import DummyLogger
+from litellm import acompletion, stream_chunk_builder, get_llm_provider, token_counter
+from litellm.utils import supports_prompt_caching
+from litellm.types.utils import ModelResponseStream, Usage
+from novagent.cache import ResponseCache
+from novagent.history import estimate_tokens
+from novagent.loggers import DummyLogger, StreamingLogger
 from novagent.system_prompt import END_CODE_TAG
 
 
 class LiteLLMModel:
+    """
+    Stream the completions of a model through LiteLLM.
+
+    A request failing or timing out before its first chunk is retried with
+    an exponential backoff, then the fallback models are tried in order.
+    Once a chunk has been streamed the request is never retried, so the
+    consumer never sees a response twice: later errors are raised.
+
+    With `hedge_after` set, a duplicate request is sent when the first chunk
+    is late and the first answering request is streamed. The prompt tokens
+    of the cancelled one are reported in a usage chunk.
+
+    Args:
+        model_id (str): The LiteLLM model id
+        api_key (str): The API key (default: from the environment)
+        api_base (str): The API base url (default: the provider one)
+        logger (Callable | StreamingLogger): Logger of the calls (default: none)
+        cache_control (bool): Mark the prompt prefixes as cacheable (default: auto)
+        cache (ResponseCache): Cache of the responses (default: none)
+        timeout (float): Timeout of a request in seconds (default: the LiteLLM one)
+        first_token_timeout (float): Seconds to wait for the first chunk (default: none)
+        retries (int): Retries of a model before the next one (default: 2)
+        backoff (float): First retry delay in seconds, then doubled (default: 0.5)
+        max_backoff (float): Maximum delay between retries in seconds (default: 8)
+        fallbacks (list[str]): Models tried in order when one fails (default: none)
+        hedge_after (float): Seconds before a duplicate request is sent (default: never)
+        hedge_model (str): Model of the duplicate request (default: the same)
+    """
+
+    # providers caching prompt prefixes only at explicit breakpoints, the
+    # others (openai, deepseek, ...) cache them automatically.
+    CACHE_CONTROL_PROVIDERS = {"anthropic", "bedrock", "vertex_ai", "vertex_ai_beta"}
+
+    # errors worth another attempt, the others (bad request, authentication,
+    # ...) would fail again.
+    RETRYABLE_ERRORS = (
+        TimeoutError,
+        litellm.Timeout,
+        litellm.RateLimitError,
+        litellm.APIConnectionError,
+        litellm.InternalServerError,
+        litellm.ServiceUnavailableError,
+    )
+
     def __init__(
         self,
         model_id: str,
         api_key: str | None = None,
         api_base: str | None = None,
-        logger: Callable[[list[dict], dict], None] | None = None,
+        logger: Callable[[list[dict], dict], None] | StreamingLogger | None = None,
+        cache_control: bool | None = None,
+        cache: ResponseCache | None = None,
+        timeout: float | None = None,
+        first_token_timeout: float | None = None,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        fallbacks: list[str] = [],
+        hedge_after: float | None = None,
+        hedge_model: str | None = None,
     ):
         self.model_id = model_id
         self.api_key = api_key
         self.api_base = api_base
         self.log = logger or DummyLogger()
+        self.cache = cache
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.fallbacks = list(fallbacks)
+        self.hedge_after = hedge_after
+        self.hedge_model = hedge_model
+        self.cache_control = {
+            model_id: (
+                self._needs_cache_control(model_id)
+                if cache_control is None
+                else cache_control
+            )
+            for model_id in [model_id, *self.fallbacks, hedge_model or model_id]
+        }
 
     async def __call__(self, messages: list[dict]):
-        stream = await acompletion(
-            model=self.model_id,
+        key = None
+
+        if self.cache is not None:
+            key = self.cache.key(self.model_id, messages, END_CODE_TAG)
+            cached = await asyncio.to_thread(self.cache.get, key)
+
+            if cached is not None:
+                for data in cached:
+                    yield ModelResponseStream(**data)
+                return
+
+        stream, iterator, wasted = await self._open(messages)
+
+        # the cancelled hedges are accounted, their prompts were still sent.
+        if wasted:
+            yield await self._wasted_usage(wasted, messages)
+
+        # the chunks are only kept when the full response is needed.
+        streaming = isinstance(self.log, StreamingLogger)
+        logged = not streaming and not isinstance(self.log, DummyLogger)
+        chunks = [] if logged or key is not None else None
+        state = self.log.start(messages) if streaming else None
+        complete = False
+
+        try:
+            async for chunk in iterator:
+                if chunks is not None:
+                    chunks.append(chunk)
+
+                if streaming:
+                    self.log.chunk(state, chunk)
+
+                yield chunk
+
+            complete = True
+        finally:
+            if streaming:
+                self.log.end(state, complete)
+
+            if not complete:
+                await iterator.aclose()
+                await self._close(stream)
+
+        if key is not None:
+            data = [chunk.model_dump() for chunk in chunks]
+            await asyncio.to_thread(self.cache.set, key, data)
+
+        if logged:
+            response = stream_chunk_builder(chunks, messages=messages)
+            self.log(messages, response.to_dict())
+
+    async def _open(self, messages: list[dict]):
+        """
+        Start a stream, retrying and falling back until a first chunk arrives.
+
+        Return the stream, an iterator over its chunks starting with the
+        first one, and the models of the cancelled hedge requests.
+        """
+        error = None
+
+        for model_id in [self.model_id, *self.fallbacks]:
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    await asyncio.sleep(self._backoff_delay(attempt))
+
+                try:
+                    stream, first, chunks, wasted = await self._hedge(
+                        model_id, messages
+                    )
+                except self.RETRYABLE_ERRORS as e:
+                    error = e
+                    continue
+
+                return stream, self._prepend(first, chunks), wasted
+
+        raise error
+
+    async def _hedge(self, model_id: str, messages: list[dict]):
+        """
+        Start the request, and a duplicate one if it is slow to answer.
+
+        The duplicate goes to the hedge model once `hedge_after` seconds
+        passed without a first chunk. The first request answering wins and
+        the other is cancelled.
+        """
+        if self.hedge_after is None:
+            return *await self._start(model_id, messages), []
+
+        requests = {asyncio.ensure_future(self._start(model_id, messages)): model_id}
+        done, pending = await asyncio.wait(requests, timeout=self.hedge_after)
+
+        if not done:
+            hedge_id = self.hedge_model or model_id
+            request = asyncio.ensure_future(self._start(hedge_id, messages))
+            requests[request] = hedge_id
+            pending.add(request)
+
+        winner = None
+
+        try:
+            while True:
+                winner = next((r for r in done if r.exception() is None), None)
+
+                if winner is not None or not pending:
+                    break
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            losers = [request for request in requests if request is not winner]
+
+            for request in losers:
+                request.cancel()
+
+            results = await asyncio.gather(*losers, return_exceptions=True)
+            wasted = []
+
+            for request, result in zip(losers, results):
+                # a loser may have answered at the same time, release its stream.
+                if isinstance(result, tuple):
+                    await self._close(result[0])
+
+                # rejected requests cost nothing, the others were processing.
+                if isinstance(result, (tuple, asyncio.CancelledError, TimeoutError)):
+                    wasted.append(requests[request])
+
+        if winner is None:
+            # every request failed, raise the last error.
+            raise done.pop().exception()
+
+        return *winner.result(), wasted
+
+    async def _start(self, model_id: str, messages: list[dict]):
+        """Send the request and wait for the first chunk of the response."""
+        stream = None
+
+        try:
+            async with asyncio.timeout(self.first_token_timeout):
+                stream = await self._completion(model_id, messages)
+                chunks = aiter(stream)
+                first = await anext(chunks, None)
+        except BaseException:
+            if stream is not None:
+                await self._close(stream)
+
+            raise
+
+        return stream, first, chunks
+
+    async def _wasted_usage(self, models: list[str], messages: list[dict]):
+        """A chunk accounting the prompts sent to the cancelled hedges."""
+        tokens = 0
+
+        for model_id in models:
+            try:
+                tokens += await asyncio.to_thread(
+                    token_counter, model=model_id, messages=messages
+                )
+            except Exception:
+                tokens += estimate_tokens(messages)
+
+        return ModelResponseStream(
+            choices=[{"delta": {}}],
+            usage=Usage(prompt_tokens=tokens, completion_tokens=0, total_tokens=tokens),
+        )
+
+    async def _completion(self, model_id: str, messages: list[dict]):
+        return await acompletion(
+            model=model_id,
             api_key=self.api_key,
             api_base=self.api_base,
-            messages=messages,
+            messages=(
+                self._with_cache_control(messages)
+                if self.cache_control[model_id]
+                else messages
+            ),
             stop=END_CODE_TAG,
             stream=True,
             stream_options={"include_usage": True},
             drop_params=True,
+            timeout=self.timeout,
+            # the retries are ours, not the ones of the provider client.
+            max_retries=0,
         )
 
-        chunks = []
+    async def _prepend(self, first, chunks):
+        if first is None:
+            return
 
-        async for chunk in stream:
-            chunks.append(chunk)
+        yield first
+
+        async for chunk in chunks:
             yield chunk
 
-        response = stream_chunk_builder(chunks, messages=messages)
+    def _backoff_delay(self, attempt: int) -> float:
+        # the jitter spreads the retries of concurrent sessions.
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _close(self, stream):
+        """Release the provider connection of a stream left before its end."""
+        completion_stream = getattr(stream, "completion_stream", None)
+
+        for name in ("aclose", "close"):
+            close = getattr(completion_stream, name, None)
+
+            if close is not None:
+                result = close()
+
+                if inspect.isawaitable(result):
+                    await result
+
+                return
+
+    def _needs_cache_control(self, model_id: str) -> bool:
+        try:
+            _, provider, _, _ = get_llm_provider(model_id, api_base=self.api_base)
+        except Exception:
+            return False
+
+        return provider in self.CACHE_CONTROL_PROVIDERS and supports_prompt_caching(
+            model_id
+        )
+
+    def _with_cache_control(self, messages: list[dict]) -> list[dict]:
+        """
+        Mark the stable prefixes of the prompt as cacheable.
+
+        The breakpoints are the system prompt and the last two user messages:
+        the last one writes the conversation in the cache and the previous one
+        reads what the last call has written.
+        """
+        users = [i for i, message in enumerate(messages) if message["role"] == "user"]
+        systems = [
+            i for i, message in enumerate(messages) if message["role"] == "system"
+        ]
+        breakpoints = set(systems[:1] + users[-2:])
 
-        self.log(messages, response.to_dict())
+        return [
+            (
+                {
+                    **message,
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": message["content"],
+                            "cache_control": {"type": "ephemeral"},
+                        }
+                    ],
+                }
+                if i in breakpoints
+                else message
+            )
+            for i, message in enumerate(messages)
+        ]
+
+
+class ScriptedModel:
+    """
+    A model replaying scripted responses, for tests and benchmarks.
+
+    It streams the chunks LiteLLMModel would, ending with a usage chunk, and
+    cuts the responses at the stop sequence like a provider. The response
+    of a call is picked by the number of assistant messages in the prompt,
+    so concurrent sessions sharing the model each get the script in order.
+
+    Args:
+        responses (list[str]): The responses, cycled through
+        chunk_size (int): Characters per chunk (default: 4)
+        delay (float): Seconds between two chunks (default: 0)
+        first_token_delay (float): Seconds before the first chunk (default: 0)
+    """
+
+    def __init__(
+        self,
+        responses: list[str],
+        chunk_size: int = 4,
+        delay: float = 0.0,
+        first_token_delay: float = 0.0,
+    ):
+        self.responses = list(responses)
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.first_token_delay = first_token_delay
+
+    @classmethod
+    def from_log(cls, path: str | Path, **kwargs) -> "ScriptedModel":
+        """Replay the responses logged by a JsonLineLogger."""
+        responses = []
+
+        with Path(path).open("r", encoding="utf-8") as f:
+            for line in f:
+                response = json.loads(line)["response"]
+                responses.append(response["choices"][0]["message"]["content"] or "")
+
+        return cls(responses, **kwargs)
+
+    async def __call__(self, messages: list[dict]):
+        step = sum(1 for message in messages if message["role"] == "assistant")
+        response = self.responses[step % len(self.responses)]
+        response = response.split(END_CODE_TAG, 1)[0]
+
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+
+        for i in range(0, len(response), self.chunk_size):
+            if i and self.delay:
+                await asyncio.sleep(self.delay)
+
+            content = response[i : i + self.chunk_size]
+            yield ModelResponseStream(choices=[{"delta": {"content": content}}])
+
+        prompt_tokens = estimate_tokens(messages)
+        completion_tokens = len(response) // 4
+
+        yield ModelResponseStream(
+            choices=[{"delta": {}, "finish_reason": "stop"}],
+            usage=Usage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
@@ -1,7 +1,17 @@
+import re
+import sys
+import json
 import time
 import asyncio
+import argparse
+from pathlib import Path
+from typing import Callable, TextIO
+from novagent.admission import RateLimiter
 from novagent.session import MessageType, NovagentSession
 
+# message types whose content is streamed in chunks instead of whole lines.
+STREAMED_TYPES = {MessageType.AGENT, MessageType.OUTPUT, MessageType.ERROR}
+
 
 class DummyRunner:
     def __init__(self, session: NovagentSession):
@@ -21,12 +31,18 @@ class StdoutRunner:
         self.session = session
         self.current_step = None
         self.current_type = None
+        self.line_start = True
 
     def run(self, task: str) -> str | None:
         return asyncio.run(self._run(task))
 
     async def _run(self, task: str) -> str | None:
         async for message in self.session.arun(task):
+            if message.step != self.current_step or message.type != self.current_type:
+                if not self.line_start:
+                    print("")
+                    self.line_start = True
+
             if message.step != self.current_step:
                 print(
                     "================================================================================"
@@ -35,15 +51,14 @@ class StdoutRunner:
                 self.current_step = message.step
 
             if message.type != self.current_type:
-                if self.current_type == MessageType.AGENT:
-                    print("")
-
                 print(f"[{message.type.name}]")
                 self.current_type = message.type
 
             print(message.content, end="")
 
-            if message.type != MessageType.AGENT:
+            if message.type in STREAMED_TYPES:
+                self.line_start = message.content.endswith("\n")
+            else:
                 print("")
 
         return self.session.final_answer_value()
@@ -54,7 +69,8 @@ class CliRunner:
     A runner that executes a session and outputs colored messages to the terminal.
 
     Features:
-    - Character-by-character printing with configurable delay to simulate text generation
+    - Output written in frames at a capped refresh rate, the stream is never slowed down
+    - Optional typewriter effect with a configurable delay between characters
     - Color-coded output by message type
     - Special highlighting for Python code blocks
 
@@ -85,19 +101,27 @@ class CliRunner:
         MessageType.FINAL: COLORS["GREEN"],
     }
 
-    def __init__(self, session: NovagentSession, char_delay=0.001):
+    # escape sequences are written whole and not delayed by the typewriter.
+    ANSI_ESCAPE = re.compile(r"(\033\[[0-9;]*m)")
+
+    def __init__(self, session: NovagentSession, char_delay=0.0, fps=30):
         """
         Initialize the CliRunner.
 
         Args:
             session (NovagentSession): The novagent session to run
-            char_delay (float): Delay in seconds between printing each character (default: 1ms)
+            char_delay (float): Delay in seconds between printing each character,
+                a typewriter effect (default: none)
+            fps (int): Maximum number of frames written per second (default: 30)
         """
         self.session = session
         self.current_step = None
         self.current_type = None
         self.in_code_block = False
+        self.line_start = True
         self.char_delay = char_delay
+        self.fps = fps
+        self.pending = []
         self.CODE_START = "```py"
         self.CODE_END = "```"
 
@@ -107,9 +131,23 @@ class CliRunner:
 
     async def _run(self, task: str) -> str | None:
         """Run the task asynchronously, processing messages as they come in."""
+        # the messages are consumed as they come, the renderer writes them
+        # to the terminal at its own pace.
+        renderer = asyncio.ensure_future(self._render())
+
+        try:
+            await self._consume(task)
+        finally:
+            renderer.cancel()
+            self._write_frame(None)
+
+        return self.session.final_answer_value()
+
+    async def _consume(self, task: str):
         async for message in self.session.arun(task):
             # Handle step transitions
             if message.step != self.current_step:
+                self._end_line()
                 self._print_step_separator()
                 self.current_step = message.step
                 self.current_type = None
@@ -123,22 +161,88 @@ class CliRunner:
             # Print message content with appropriate styling
             if message.type == MessageType.AGENT:
                 self._print_agent_content(message.content)
+            elif message.type in STREAMED_TYPES:
+                # Output chunks carry their own newlines
+                self._print_colored_content(
+                    message.content, self.TYPE_COLORS[message.type]
+                )
             else:
                 self._print_colored_content(
                     message.content, self.TYPE_COLORS[message.type], add_newline=True
                 )
 
-        return self.session.final_answer_value()
+    async def _render(self):
+        """Write the pending text once per frame."""
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        allowance = 0.0  # characters the typewriter may show
+
+        while True:
+            await asyncio.sleep(1 / self.fps)
+
+            now = loop.time()
+
+            if not self.char_delay:
+                self._write_frame(None)
+            elif self.pending:
+                allowance += (now - last) / self.char_delay
+                allowance -= self._write_frame(int(allowance))
+
+                # no burst of characters once the backlog is written.
+                if not self.pending:
+                    allowance = 0.0
+
+            last = now
+
+    def _write_frame(self, limit: int | None) -> int:
+        """Write up to `limit` visible characters of the pending text, return the count."""
+        text = "".join(self.pending)
+        self.pending = []
+
+        if not text:
+            return 0
+
+        if limit is None:
+            frame, count = text, len(text)
+        else:
+            parts = self.ANSI_ESCAPE.split(text)
+            shown = []
+            count = 0
+
+            for i, part in enumerate(parts):
+                if i % 2 == 0:
+                    part = part[: limit - count]
+                    count += len(part)
+
+                shown.append(part)
+
+                if count == limit:
+                    break
+
+            frame = "".join(shown)
+
+            if len(frame) < len(text):
+                self.pending = [text[len(frame) :]]
+
+        sys.stdout.write(frame)
+        sys.stdout.flush()
+
+        return count
 
     def _print_step_separator(self):
         """Print a separator line between steps."""
         separator = "================================================================================"
         self._print_colored_content(separator, self.COLORS["GREY"], add_newline=True)
 
+    def _end_line(self):
+        """Terminate the line left open by streamed content."""
+        if not self.line_start:
+            self._write("\n")
+            self.line_start = True
+
     def _print_message_type_header(self, message_type):
         """Print the message type header."""
-        if self.current_type == MessageType.AGENT:
-            self._print_with_delay("\n")
+        self._end_line()
 
         header = f"[{message_type.name}]"
         self._print_colored_content(
@@ -150,7 +254,9 @@ class CliRunner:
         text = f"{color}{content}{self.COLORS['RESET']}"
         if add_newline:
             text += "\n"
-        self._print_with_delay(text)
+        if content or add_newline:
+            self.line_start = add_newline or content.endswith("\n")
+        self._write(text)
 
     def _print_agent_content(self, content):
         """Handle agent messages with special processing for code blocks."""
@@ -226,8 +332,295 @@ class CliRunner:
             self._print_colored_content(after_start, self.COLORS["YELLOW"])
             self.in_code_block = True
 
-    def _print_with_delay(self, text):
-        """Print text character by character with a small delay between each character."""
-        for char in text:
-            print(char, end="", flush=True)
-            time.sleep(self.char_delay)
+    def _write(self, text):
+        """Queue text for the next frame."""
+        self.pending.append(text)
+
+
+class BatchRunner:
+    """
+    A runner that executes the tasks of a JSONL file, each in its own session.
+
+    Up to `concurrency` tasks run at the same time and the model calls are
+    paced under the provider quotas. The tasks are read as they are needed
+    and every result is written to the output as soon as it is known, so a
+    run can be stopped at any time and resumed later.
+
+    An input line is either a JSON string, the task, or an object with a
+    "task" field and an optional "id" (default: the line number). The other
+    fields are copied to the result, along with the answer, the error, the
+    number of steps, the tokens and the duration.
+
+    Args:
+        session_factory (Callable): Builds the session of a task, e.g. `config.session`
+        concurrency (int): Maximum number of tasks running at once (default: 8)
+        requests_per_minute (float): Model requests per minute (default: unlimited)
+        tokens_per_minute (float): Model tokens per minute (default: unlimited)
+        timeout (float): Maximum duration of a task in seconds (default: none)
+        on_result (Callable): Called with every result written (default: none)
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], NovagentSession],
+        concurrency: int = 8,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        timeout: float | None = None,
+        on_result: Callable[[dict], None] | None = None,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.timeout = timeout
+        self.on_result = on_result
+
+    def run(
+        self, input: str | Path | TextIO, output: str | Path, resume: bool = False
+    ) -> dict:
+        """
+        Run the tasks of `input` (a path, "-" for stdin, or a file) and append
+        the results to `output`, return the number of tasks by outcome.
+
+        With `resume` the tasks already answered in the output are skipped.
+        The failed ones are run again, the last result of an id is the one.
+        """
+        return asyncio.run(self._run(input, output, resume))
+
+    async def _run(
+        self, input: str | Path | TextIO, output: str | Path, resume: bool
+    ) -> dict:
+        done = self._answered(Path(output)) if resume else set()
+        counts = {"answered": 0, "failed": 0, "skipped": 0}
+
+        if input == "-":
+            input = sys.stdin
+
+        source = open(input) if isinstance(input, (str, Path)) else input
+        lines = enumerate(source, 1)
+        reading = asyncio.Lock()
+
+        # shared by the sessions, they all call the same provider.
+        limiter = None
+
+        if self.requests_per_minute or self.tokens_per_minute:
+            limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+
+        async def next_item() -> tuple[dict, str | None] | None:
+            # reading may block (a pipe), it is kept off the event loop.
+            async with reading:
+                while line := await asyncio.to_thread(next, lines, None):
+                    number, text = line
+
+                    if not text.strip():
+                        continue
+
+                    # an invalid line fails its task only, not the run.
+                    try:
+                        item = self._parse(text)
+                    except ValueError as e:
+                        return {"id": number}, f"Invalid task: {e}"
+
+                    item.setdefault("id", number)
+
+                    if item["id"] in done:
+                        counts["skipped"] += 1
+                        continue
+
+                    return item, None
+
+        async def worker(results: TextIO):
+            while (line := await next_item()) is not None:
+                item, error = line
+
+                if error is None:
+                    result = await self._run_task(item, limiter)
+                else:
+                    result = self._result(item, error=error)
+                results.write(json.dumps(result, default=str) + "\n")
+                results.flush()
+
+                counts["failed" if result["error"] else "answered"] += 1
+
+                if self.on_result:
+                    self.on_result(result)
+
+        try:
+            with open(output, "a") as results:
+                async with asyncio.TaskGroup() as group:
+                    for _ in range(self.concurrency):
+                        group.create_task(worker(results))
+        finally:
+            if source is not input:
+                source.close()
+
+        return counts
+
+    async def _run_task(self, item: dict, limiter: RateLimiter | None) -> dict:
+        # a session that can not be built fails its task only, not the run.
+        try:
+            session = self.session_factory()
+        except Exception as e:
+            return self._result(item, error=f"{type(e).__name__}: {e}")
+
+        if limiter is not None:
+            session.model = _rate_limited(session.model, limiter)
+
+        started = time.perf_counter()
+        deadline = asyncio.timeout(self.timeout)
+        error = None
+
+        try:
+            try:
+                async with deadline:
+                    async for _ in session.arun(item["task"]):
+                        pass
+            # the model raises its own TimeoutError, e.g. with no first token.
+            except TimeoutError as e:
+                if deadline.expired():
+                    error = f"Timed out after {self.timeout}s"
+                else:
+                    error = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if error is None and not session.context.has_final_answer:
+                error = "No final answer"
+
+            return self._result(item, session, error, time.perf_counter() - started)
+        finally:
+            session.context.close()
+
+    def _parse(self, text: str) -> dict:
+        """The task of an input line, raise a ValueError when it is invalid."""
+        item = json.loads(text)
+        item = item if isinstance(item, dict) else {"task": item}
+
+        if not isinstance(item.get("task"), str):
+            raise ValueError('expected a string or an object with a "task" string')
+
+        return item
+
+    def _result(
+        self,
+        item: dict,
+        session: NovagentSession | None = None,
+        error: str | None = None,
+        duration: float = 0.0,
+    ) -> dict:
+        return {
+            **item,
+            "answer": session.final_answer_value() if session else None,
+            "error": error,
+            "steps": session.nstep if session else 0,
+            "prompt_tokens": session.prompt_tokens if session else 0,
+            "completion_tokens": session.completion_tokens if session else 0,
+            "duration": duration,
+        }
+
+    def _answered(self, output: Path) -> set:
+        """The ids answered in the output, a line cut by a crash is dropped."""
+        if not output.exists():
+            return set()
+
+        with open(output, "r+b") as file:
+            data = file.read()
+            end = data.rfind(b"\n") + 1
+
+            if end < len(data):
+                file.truncate(end)
+
+        answered = set()
+
+        for line in data[:end].splitlines():
+            # a corrupt line is ignored, its task runs again.
+            try:
+                result = json.loads(line)
+                task_id, error = result["id"], result.get("error")
+            except (ValueError, TypeError, KeyError, AttributeError):
+                continue
+
+            if error is None:
+                answered.add(task_id)
+            else:
+                answered.discard(task_id)
+
+        return answered
+
+
+def _rate_limited(model: Callable, limiter: RateLimiter) -> Callable:
+    """Wrap a model so its calls wait for the limiter and charge their usage."""
+
+    async def call(messages: list[dict]):
+        await limiter.acquire()
+
+        stream = model(messages)
+        tokens = 0
+
+        try:
+            async for chunk in stream:
+                usage = chunk.get("usage") or {}
+                tokens += (usage.get("prompt_tokens") or 0) + (
+                    usage.get("completion_tokens") or 0
+                )
+                yield chunk
+        finally:
+            limiter.charge(tokens)
+
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+    return call
+
+
+def main():
+    """Run the tasks of a JSONL file with a LiteLLM model."""
+    # imported here, the config imports the runners.
+    from novagent.config import NovagentConfig
+    from novagent.models import LiteLLMModel
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("input", help='JSONL file of the tasks, "-" for stdin')
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--model", required=True, help="LiteLLM model id")
+    parser.add_argument("--api-key")
+    parser.add_argument("--api-base")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, help="threads running the code")
+    parser.add_argument("--rpm", type=float, help="model requests per minute")
+    parser.add_argument("--tpm", type=float, help="model tokens per minute")
+    parser.add_argument("--timeout", type=float, help="seconds per task")
+    parser.add_argument(
+        "--resume", action="store_true", help="skip the tasks already answered"
+    )
+    args = parser.parse_args()
+
+    model = LiteLLMModel(args.model, api_key=args.api_key, api_base=args.api_base)
+    config = NovagentConfig(model, max_workers=args.workers or args.concurrency)
+
+    def report(result: dict):
+        status = f"error: {result['error']}" if result["error"] else "answered"
+        print(
+            f"{result['id']}: {status} "
+            f"({result['steps']} steps, {result['duration']:.1f}s)",
+            file=sys.stderr,
+        )
+
+    runner = BatchRunner(
+        config.session,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        timeout=args.timeout,
+        on_result=report,
+    )
+    counts = runner.run(args.input, args.output, resume=args.resume)
+
+    print(
+        ", ".join(f"{count} {name}" for name, count in counts.items()), file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,300 @@
 import json
+import asyncio
 from uuid import uuid4
+from typing import AsyncIterator, Callable
 from pydantic import BaseModel
 from cachetools import TTLCache
-from fastapi import FastAPI, Header, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from novagent.config import NovagentConfig
+from novagent.session import Message, MessageType, NovagentSession
+from novagent.stores import MemorySessionStore
+from novagent.metrics import StepMetrics
+from novagent.admission import (
+    AdmissionController,
+    SessionBusyError,
+    QueueFullError,
+)
 
 
 # --- Configuration and Cache Setup ---
 SESSION_TTL_SECONDS = 1500  # cache session for 20 minutes
+
+# live sessions of this worker, the store is the source of truth: a session
+# missing here (evicted, other worker, restart) is rehydrated from it.
 cache = TTLCache(maxsize=100, ttl=SESSION_TTL_SECONDS)
 
 
+# --- SSE Encoding ---
+# message types streamed in chunks, merged by the coalescing mode.
+COALESCED_TYPES = {MessageType.AGENT, MessageType.OUTPUT, MessageType.ERROR}
+COALESCE_MAX_SIZE = 4096  # characters
+FRAME_QUEUE_SIZE = 64  # frames waiting for a slow client before the run waits
+
+
+def sse(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+async def coalesce_messages(
+    messages: AsyncIterator[Message],
+    window: float,
+    max_size: int = COALESCE_MAX_SIZE,
+) -> AsyncIterator[Message]:
+    """
+    Merge consecutive chunks of the same type arriving within `window` seconds.
+
+    The messages are merged inline as they arrive, without a task of their
+    own. A merged message is emitted with the first message arriving after
+    its window, when it reaches `max_size` characters, when a message of
+    another kind arrives or at the end: a pause of the stream holds it until
+    the next message.
+    """
+    loop = asyncio.get_running_loop()
+    pending = []
+    pending_size = 0
+    deadline = 0
+
+    def flush() -> Message:
+        nonlocal pending, pending_size
+        content = "".join(message.content for message in pending)
+        message = Message(pending[0].type, pending[0].step, content)
+        pending = []
+        pending_size = 0
+        return message
+
+    async for message in messages:
+        if pending and (
+            message.type != pending[0].type
+            or message.step != pending[0].step
+            or loop.time() >= deadline
+        ):
+            yield flush()
+
+        if message.type not in COALESCED_TYPES:
+            yield message
+            continue
+
+        if not pending:
+            deadline = loop.time() + window
+
+        pending.append(message)
+        pending_size += len(message.content)
+
+        if pending_size >= max_size:
+            yield flush()
+
+    if pending:
+        yield flush()
+
+
+async def cancel_on_disconnect(request: Request, cancel: Callable[[], None]):
+    """Call `cancel` as soon as the client goes away."""
+    while True:
+        message = await request.receive()
+
+        if message["type"] == "http.disconnect":
+            cancel()
+            return
+
+
 class TaskRequest(BaseModel):
     task: str
 
 
 # --- Server Factory ---
-def create_server(config: NovagentConfig) -> FastAPI:
+def create_server(
+    config: NovagentConfig,
+    store=None,
+    admission: AdmissionController | None = None,
+    coalesce: float | None = None,
+) -> FastAPI:
+    """
+    Create the FastAPI app serving the sessions of the config.
+
+    With `coalesce` set to a window in seconds, consecutive chunks are sent
+    in one SSE frame instead of one frame per model chunk. A run is cancelled
+    when its client disconnects or on `DELETE /run`. The timings of the steps
+    and the load are exposed in the Prometheus format on `/metrics`.
+
+    With a shared store, a session cached by a worker is reloaded when the
+    store holds a newer version, saved by another worker. The admission of
+    the runs is per worker though: two workers may run the same session at
+    once and the last one saved wins, route a session to one worker at a
+    time to prevent it.
+    """
     app = FastAPI()
+    store = store or MemorySessionStore(ttl=SESSION_TTL_SECONDS)
+    admission = admission or AdmissionController()
+    runs = {}  # session id -> task of the running run
+    metrics = StepMetrics()
+
+    async def get_session(session_id: str) -> NovagentSession | None:
+        session = cache.get(session_id)
+
+        # another worker may have run the session since, the store tells.
+        if session is not None:
+            version = await store.version(session_id)
+
+            if version == session.version:
+                return session
+
+            cache.pop(session_id, None)
+
+        state = await store.get(session_id)
+
+        if state is None:
+            return None
+
+        session = await asyncio.to_thread(config.session, session_id)
+        await asyncio.to_thread(session.load_state, state)
+        cache[session_id] = session
+
+        return session
+
+    async def save(session_id: str, session: NovagentSession):
+        session.version += 1
+        await store.set(session_id, await asyncio.to_thread(session.state))
 
     @app.post("/session")
     async def create_session():
         session_id = str(uuid4())
-        session = config.session()
+
+        # forking the template context copies its variables, off the event loop.
+        session = await asyncio.to_thread(config.session, session_id)
+        await save(session_id, session)
         cache[session_id] = session
         return {"session_id": session_id}
 
     @app.post("/run")
     async def run_task(
-        body: TaskRequest, session_id: str = Header(..., alias="X-Session-ID")
+        body: TaskRequest,
+        request: Request,
+        session_id: str = Header(..., alias="X-Session-ID"),
     ):
-        if session_id not in cache:
+        session = await get_session(session_id)
+
+        if session is None:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        session = cache[session_id]
+        try:
+            ticket = admission.admit(session_id)
+        except SessionBusyError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e))
 
-        async def event_generator():
+        # the run waits for the client once the queue is full.
+        frames = asyncio.Queue(FRAME_QUEUE_SIZE)
+        reading = True
+
+        async def send(frame: str | None):
+            # the stream was left, nothing reads the frames anymore.
+            if reading:
+                await frames.put(frame)
+
+        async def produce():
             try:
-                async for message in session.arun(body.task):
-                    yield f"data: {json.dumps({'type': message.type.name, 'content': message.content})}\n\n"
+                # report the position in the queue until a slot is free.
+                async for position in ticket.wait():
+                    await send(sse({"type": "QUEUED", "content": position}))
+
+                messages = session.arun(body.task)
+
+                if coalesce:
+                    messages = coalesce_messages(messages, coalesce)
+
+                async for message in messages:
+                    data = {"type": message.type.name, "content": message.content}
 
-                yield f"[DONE]\n\n"
+                    # the INFO message of a step carries its timings.
+                    if message.data is not None:
+                        data["data"] = message.data
+                        metrics.observe(message.data)
+
+                    await send(sse(data))
+
+                await send("data: [DONE]\n\n")
+            except asyncio.CancelledError:
+                await send(sse({"type": "CANCELLED", "content": None}))
+                await send("data: [DONE]\n\n")
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+                await send(sse({"type": "error", "content": str(e)}))
+                await send("data: [DONE]\n\n")
+            finally:
+                # snapshot the history and the variables for a later rehydration,
+                # before the stream ends so leaving it can not cancel the save.
+                try:
+                    await asyncio.shield(save(session_id, session))
+                finally:
+                    ticket.release()
+                    await send(None)
+
+        async def event_generator():
+            # the run is a task of its own so a disconnection or DELETE /run
+            # can cancel it, stopping the model stream and the running code.
+            task = asyncio.ensure_future(produce())
+
+            def stop():
+                nonlocal reading
+
+                # the client is gone, the run and its pending frames are dropped.
+                reading = False
+                task.cancel()
+
+                while not frames.empty():
+                    frames.get_nowait()
+
+                frames.put_nowait(None)
+
+            watcher = asyncio.ensure_future(cancel_on_disconnect(request, stop))
+            runs[session_id] = task
+
+            finished = False
+
+            try:
+                while (frame := await frames.get()) is not None:
+                    yield frame
+
+                finished = True
+            finally:
+                watcher.cancel()
+
+                # the stream was left early, the run is not needed anymore.
+                if not finished:
+                    stop()
+
+                if runs.get(session_id) is task:
+                    del runs[session_id]
+
+        return StreamingResponse(
+            event_generator(),
+            media_type="text/event-stream",
+            background=BackgroundTask(ticket.release),
+        )
+
+    @app.delete("/run")
+    async def cancel_task(session_id: str = Header(..., alias="X-Session-ID")):
+        task = runs.get(session_id)
+
+        if task is None:
+            raise HTTPException(status_code=404, detail="No task running")
+
+        task.cancel()
+
+        return {"cancelled": True}
+
+    @app.get("/metrics")
+    async def get_metrics():
+        gauges = {
+            "novagent_active_runs": ("Runs holding a slot", admission.active),
+            "novagent_queued_runs": ("Runs waiting for a slot", len(admission.waiters)),
+            "novagent_live_sessions": ("Sessions loaded in this worker", len(cache)),
+        }
 
-        return StreamingResponse(event_generator(), media_type="text/event-stream")
+        return PlainTextResponse(
+            metrics.render(gauges), media_type="text/plain; version=0.0.4"
+        )
 
     return app
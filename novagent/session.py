@@ -1,7 +1,14 @@
 import re
+import time
+import base64
+import asyncio
 from enum import Enum
+from uuid import uuid4
+from concurrent.futures import Executor
 from typing import AsyncIterator, Callable, Any
-from novagent.context import PythonContext
+from novagent.context import PythonContext, format_profile
+from novagent.history import FullHistory, estimate_tokens
+from novagent.loggers import DummyLogger, current_session_id
 from novagent.system_prompt import END_CODE_TAG
 
 
@@ -14,32 +21,94 @@ class MessageType(Enum):
 
 
 class Message:
-    def __init__(self, type: MessageType, step: int, content: str):
+    def __init__(self, type: MessageType, step: int, content: str, data=None):
         self.type = type
         self.step = step
         self.content = content
+        self.data = data  # structured content, the timings of a step for INFO
 
     def __repr__(self):
         return f"Message({self.type.name}, {self.step}, {self.content})"
 
 
+class _CodeBlockParser:
+    """
+    Detect the end of the first python code block as the chunks arrive.
+
+    Only the last few characters of the previous chunks are kept, to match
+    the markers split across chunks, so each chunk is scanned once.
+    """
+
+    START = "```py"
+    END = "```"
+
+    def __init__(self):
+        self.marker = self.START
+        self.tail = ""
+
+    def feed(self, content: str) -> bool:
+        """Add a chunk, return whether the code block is complete."""
+        text = self.tail + content
+
+        if self.marker == self.START:
+            index = text.find(self.START)
+
+            if index == -1:
+                self.tail = text[-(len(self.START) - 1) :]
+                return False
+
+            self.marker = self.END
+            text = text[index + len(self.START) :]
+
+        if text.find(self.END) != -1:
+            return True
+
+        self.tail = text[-(len(self.END) - 1) :]
+
+        return False
+
+
 class NovagentSession:
     """
     A session that processes a task by generating and executing code using an LLM model.
     This class is designed as an async iterator that yields Message objects.
     """
 
+    # how long the end of the model stream is waited for after the code block.
+    STREAM_END_TIMEOUT = 1.0
+
+    # characters sent after the code block before the stream is closed.
+    MAX_TRAILING_CHARS = 2000
+
+    # output messages waiting for the consumer before the code is held back.
+    OUTPUT_QUEUE_SIZE = 64
+
     def __init__(
         self,
         model: Callable[[list[dict]], Any],
         context: PythonContext,
         system_prompt: str,
+        executor: Executor | None = None,
+        history: Callable[[list[dict]], Any] | None = None,
+        session_id: str | None = None,
+        logger=None,
+        profile_feedback: float | None = None,
     ):
+        self.id = session_id or uuid4().hex
         self.model = model
         self.context = context
+        self.executor = executor
+        self.history = history or FullHistory()
+        self.logger = logger or DummyLogger()
+        # steps running longer get their profile in the observation.
+        self.profile_feedback = profile_feedback
         self.nstep = 0
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.saved_tokens = 0
+        self.lost_variables = []
+        self.version = 0  # bumped on every save, see load_state
         self.messages = [
             {"role": "system", "content": system_prompt},
         ]
@@ -47,6 +116,51 @@ class NovagentSession:
     def final_answer_value(self) -> str | None:
         return self.context.final_answer_value
 
+    def state(self) -> dict:
+        """
+        The JSON serializable state of the session, see load_state.
+
+        It includes a snapshot of the context variables, which may be slow
+        for large ones: call it outside of the event loop.
+        """
+        data, skipped = self.context.snapshot()
+
+        return {
+            "id": self.id,
+            "version": self.version,
+            "messages": [dict(message) for message in self.messages],
+            "nstep": self.nstep,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "saved_tokens": self.saved_tokens,
+            "context": base64.b64encode(data).decode("ascii"),
+            "skipped": skipped,
+        }
+
+    def load_state(self, state: dict):
+        """
+        Restore the history, the token counts and the context variables.
+
+        The version tells a stale copy of the session (e.g. kept by a worker
+        while another one ran it) from the state saved last.
+        """
+        self.id = state.get("id", self.id)
+        self.version = state.get("version", 0)
+        self.messages = [dict(message) for message in state["messages"]]
+        self.nstep = state["nstep"]
+        self.prompt_tokens = state["prompt_tokens"]
+        self.completion_tokens = state["completion_tokens"]
+        self.cached_tokens = state.get("cached_tokens", 0)
+        self.saved_tokens = state.get("saved_tokens", 0)
+
+        # variables lost on the way, reported on the next run.
+        self.lost_variables = list(state.get("skipped", []))
+
+        if "context" in state:
+            data = base64.b64decode(state["context"])
+            self.lost_variables.extend(self.context.restore(data))
+
     async def arun(self, task: str) -> AsyncIterator[Message]:
         """
         Run the session on the given task and yield messages as they, self.nstep are produced.
@@ -56,58 +170,143 @@ class NovagentSession:
         # clear the last final answer when run is called again.
         self.context.clear_final_answer()
 
-        # add the task to the message list.
-        self._add_user_message(f"Task: {task}")
+        # the model calls of the task are logged under the session id.
+        current_session_id.set(self.id)
+
+        # add the task to the message list, warning about the variables
+        # which could not be restored with the session.
+        if self.lost_variables:
+            names = ", ".join(self.lost_variables)
+            self.lost_variables = []
+            yield Message(
+                MessageType.INFO, self.nstep, f"Variables not restored: {names}"
+            )
+            note = f"Note: these variables were lost, define them again: {names}"
+            self._add_user_message(f"{note}\n\nTask: {task}")
+        else:
+            self._add_user_message(f"Task: {task}")
 
         # loop until a final answer.
         while not self.context.has_final_answer:
             # update the current step info and yield it.
             self.nstep += 1
 
-            # get model response as a stream and emit it.
-            message = ""
-            async for agent_message in self._call_model():
-                yield agent_message
-                message += agent_message.content
+            # get model response as a stream and emit it until the code is complete.
+            contents = []
+            parser = _CodeBlockParser()
+            stream = self._call_model()
+            completion_tokens = self.completion_tokens
+            started = time.perf_counter()
+            first_token = None
+
+            try:
+                async for agent_message in stream:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+
+                    yield agent_message
+                    contents.append(agent_message.content)
+
+                    if parser.feed(agent_message.content):
+                        break
+            except BaseException:
+                # cancelled mid-answer: stop the generation right away.
+                await stream.aclose()
+                raise
+
+            generated = time.perf_counter()
 
             # try to extract thought and code from the model response.
-            thought, code = self._extract_thought_and_code(message)
+            thought, code = self._extract_thought_and_code("".join(contents))
 
             if not code:
+                await stream.aclose()
                 yield Message(MessageType.ERROR, self.nstep, f"No code produced.")
                 break
 
+            # the code runs while the end of the stream is consumed for its usage.
+            tail = asyncio.ensure_future(self._finish_stream(stream))
+
             # add the assistant message in the list.
             self._add_assistant_message(f"{thought}\n```py\n{code}\n```{END_CODE_TAG}")
 
-            # run the produced code.
-            out, err = self.context.run(code)
+            # run the produced code and stream its output while it runs.
+            chunks = asyncio.Queue(self.OUTPUT_QUEUE_SIZE)
+            execution_started = time.perf_counter()
+            execution = asyncio.ensure_future(self._execute(code, chunks))
+
+            try:
+                while (chunk := await chunks.get()) is not None:
+                    yield chunk
+
+                out, err = await execution
+                executed = time.perf_counter()
+            finally:
+                # the run was cancelled or left: stop the code rather than let it run.
+                if not execution.done():
+                    execution.cancel()
+                    self.context.interrupt("Execution cancelled")
+                    tail.cancel()
+
+            await self._wait_stream_end(tail)
 
             # build the "user" message and add it to the list.
             parts = []
             observations = []
 
             if len(out) > 0:
-                yield Message(MessageType.OUTPUT, self.nstep, out)
                 observations.append(out)
 
             if len(err) > 0:
-                yield Message(MessageType.ERROR, self.nstep, err)
                 observations.append(err)
 
             if len(observations) > 0:
                 parts.append(f"Observation:\n{"\n".join(observations)}")
 
+            # profile of the execution, when the context takes one.
+            profile = self.context.last_profile
+
+            if profile is not None:
+                if hasattr(self.logger, "event"):
+                    self.logger.event("profile", {"step": self.nstep, **profile})
+
+                if (
+                    self.profile_feedback is not None
+                    and profile["duration"] >= self.profile_feedback
+                    and not self.context.has_final_answer
+                ):
+                    parts.append(format_profile(profile))
+
             if self.context.has_final_answer:
                 yield Message(
                     MessageType.FINAL, self.nstep, self.context.final_answer_value
                 )
                 parts.append(f"Final:\n{self.context.final_answer_value}")
 
-            # yield end of step sumup.
-            yield Message(MessageType.INFO, self.nstep, self._current_step_info())
+            observation = "\n".join(parts)
 
-            self._add_user_message("\n".join(parts))
+            # yield end of step sumup.
+            step_tokens = self.completion_tokens - completion_tokens
+            generation = generated - (first_token or started)
+            timings = {
+                "ttft": first_token - started if first_token else None,
+                "generation": generation,
+                "tokens_per_sec": (
+                    step_tokens / generation if step_tokens and generation else None
+                ),
+                "execution": executed - execution_started,
+                "observation_chars": len(observation),
+                "profile": profile,
+            }
+
+            yield Message(
+                MessageType.INFO,
+                self.nstep,
+                self._current_step_info(timings),
+                timings,
+            )
+
+            self._add_user_message(observation)
 
     def _add_user_message(self, content: str):
         self.messages.append({"role": "user", "content": content})
@@ -115,23 +314,117 @@ class NovagentSession:
     def _add_assistant_message(self, content: str):
         self.messages.append({"role": "assistant", "content": content})
 
+    async def _finish_stream(self, stream: AsyncIterator[Message]):
+        """
+        Consume what the model sends after the code block.
+
+        The stream is drained to its end for the usage chunk, accounted by
+        _call_model, and the logging and caching of the response. Trailing
+        content, such as a newline before the stop sequence, is discarded.
+        Past MAX_TRAILING_CHARS the model kept going past the stop sequence:
+        the stream is closed so it is not generated for nothing.
+        """
+        trailing = 0
+
+        try:
+            async for message in stream:
+                trailing += len(message.content)
+
+                if trailing > self.MAX_TRAILING_CHARS:
+                    break
+        finally:
+            await stream.aclose()
+
+    async def _wait_stream_end(self, tail: asyncio.Future):
+        try:
+            await asyncio.wait_for(tail, self.STREAM_END_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
     async def _call_model(self) -> AsyncIterator[Message]:
-        async for chunk in self.model(self.messages):
-            content = chunk.choices[0].delta.content
+        # the history strategy decides what part of the conversation is sent.
+        messages = await self.history(self.messages)
+
+        if messages is not self.messages:
+            saved = self.history.count(self.messages) - self.history.count(messages)
+            self.saved_tokens = self.saved_tokens + saved
+
+        stream = self.model(messages)
+        generated = []
+        usage_seen = False
+        finished = False
+
+        try:
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content
+
+                usage = chunk.get("usage", {})
+                prompt_tokens = usage.get("prompt_tokens", None)
+                completion_tokens = usage.get("completion_tokens", None)
+                cached_tokens = self._cached_tokens(usage)
+
+                if prompt_tokens or completion_tokens:
+                    usage_seen = True
+
+                if content:
+                    generated.append(content)
+                    # Yield each chunk as it arrives
+                    yield Message(MessageType.AGENT, self.nstep, content)
+
+                if prompt_tokens:
+                    self.prompt_tokens = self.prompt_tokens + prompt_tokens
+
+                if completion_tokens:
+                    self.completion_tokens = self.completion_tokens + completion_tokens
+
+                if cached_tokens:
+                    self.cached_tokens = self.cached_tokens + cached_tokens
+
+            finished = True
+        finally:
+            # close the model stream when it is left before its end.
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+            # left before the usage chunk, the tokens are still paid for.
+            if not finished and not usage_seen:
+                content = "".join(generated)
+                self.prompt_tokens = self.prompt_tokens + estimate_tokens(messages)
+                self.completion_tokens = self.completion_tokens + estimate_tokens(
+                    [{"content": content}]
+                )
+
+    def _cached_tokens(self, usage) -> int | None:
+        """Prompt tokens read from the provider cache, part of the prompt tokens."""
+        details = usage.get("prompt_tokens_details", None)
 
-            usage = chunk.get("usage", {})
-            prompt_tokens = usage.get("prompt_tokens", None)
-            completion_tokens = usage.get("completion_tokens", None)
+        if isinstance(details, dict):
+            cached_tokens = details.get("cached_tokens", None)
+        else:
+            cached_tokens = getattr(details, "cached_tokens", None)
 
-            if content:
-                # Yield each chunk as it arrives
-                yield Message(MessageType.AGENT, self.nstep, content)
+        return cached_tokens or usage.get("cache_read_input_tokens", None)
 
-            if prompt_tokens:
-                self.prompt_tokens = self.prompt_tokens + prompt_tokens
+    async def _execute(self, code: str, chunks: asyncio.Queue) -> tuple[str, str]:
+        """Run the code, queuing its output messages until None marks the end."""
 
-            if completion_tokens:
-                self.completion_tokens = self.completion_tokens + completion_tokens
+        # the code waits for the consumer once the queue is full.
+        async def on_output(index: int, text: str):
+            type = MessageType.OUTPUT if index == 0 else MessageType.ERROR
+            await chunks.put(Message(type, self.nstep, text))
+
+        cancelled = False
+
+        try:
+            # off the event loop when an executor is set.
+            return await self.context.arun(code, self.executor, on_output)
+        except asyncio.CancelledError:
+            # cancelled once the consumer left, nothing reads the queue anymore.
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                await chunks.put(None)
 
     def _extract_thought_and_code(self, text: str) -> tuple[str, str | None]:
         """Try to extract the thought and code parts"""
@@ -146,11 +439,31 @@ class NovagentSession:
 
         return thought, code
 
-    def _current_step_info(self) -> str:
-        """Get a formatted string with token usage information."""
+    def _current_step_info(self, timings: dict) -> str:
+        """Get a formatted string with token usage and timing information."""
+
+        info = self._tokens_info(f"Step {self.nstep}")
+
+        if self.cached_tokens:
+            info = f"{info} - Cached tokens {self.cached_tokens}"
+
+        if self.saved_tokens:
+            info = f"{info} - Saved tokens {self.saved_tokens}"
+
+        if timings["ttft"] is not None:
+            info = f"{info} - TTFT {timings['ttft']:.2f}s"
+
+        info = f"{info} - Generation {timings['generation']:.2f}s"
+
+        if timings["tokens_per_sec"] is not None:
+            info = f"{info} ({timings['tokens_per_sec']:.1f} tokens/s)"
+
+        info = f"{info} - Execution {timings['execution']:.2f}s"
+        info = f"{info} - Observation {timings['observation_chars']} chars"
 
-        base = f"Step {self.nstep}"
+        return info
 
+    def _tokens_info(self, base: str) -> str:
         if not self.prompt_tokens and not self.completion_tokens:
             return base
 
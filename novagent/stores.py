@@ -0,0 +1,151 @@
+import json
+import math
+import time
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from cachetools import TTLCache
+
+
+class MemorySessionStore:
+    """
+    Keep the session states in the server process memory.
+
+    States are lost on restart and are not shared between workers, use it
+    for a single worker.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 1500):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, session_id: str) -> dict | None:
+        return self.cache.get(session_id)
+
+    async def version(self, session_id: str) -> int | None:
+        state = self.cache.get(session_id)
+        return state.get("version", 0) if state is not None else None
+
+    async def set(self, session_id: str, state: dict):
+        # a state is a copy made for the store, it is kept without encoding it.
+        self.cache[session_id] = state
+
+    async def delete(self, session_id: str):
+        self.cache.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """
+    Keep the session states in a SQLite file.
+
+    States survive restarts and are shared by the workers of a node. Queries
+    run in a thread so they do not block the event loop.
+    """
+
+    def __init__(self, path: str | Path, ttl: float = 1500):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, "
+            "state TEXT NOT NULL, expires REAL NOT NULL, version INTEGER NOT NULL)"
+        )
+
+        # databases created before the version column.
+        try:
+            self.connection.execute(
+                "ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+            )
+        except sqlite3.OperationalError:
+            pass
+
+    async def get(self, session_id: str) -> dict | None:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def version(self, session_id: str) -> int | None:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT version FROM sessions WHERE id = ? AND expires > ?",
+            session_id,
+            time.time(),
+        )
+
+        return rows[0][0] if rows else None
+
+    async def set(self, session_id: str, state: dict):
+        await asyncio.to_thread(self._set, session_id, state)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE id = ?", session_id
+        )
+
+    def _get(self, session_id: str) -> dict | None:
+        rows = self._execute(
+            "SELECT state FROM sessions WHERE id = ? AND expires > ?",
+            session_id,
+            time.time(),
+        )
+
+        return json.loads(rows[0][0]) if rows else None
+
+    def _set(self, session_id: str, state: dict):
+        data = json.dumps(state)
+        now = time.time()
+
+        self._execute(
+            "INSERT OR REPLACE INTO sessions (id, state, expires, version) "
+            "VALUES (?, ?, ?, ?)",
+            session_id,
+            data,
+            now + self.ttl,
+            state.get("version", 0),
+        )
+
+        self._execute("DELETE FROM sessions WHERE expires <= ?", now)
+
+    def _execute(self, query: str, *args) -> list[tuple]:
+        with self.lock:
+            return self.connection.execute(query, args).fetchall()
+
+
+class RedisSessionStore:
+    """
+    Keep the session states in Redis, shared by all the workers and nodes.
+
+    Any client implementing the `redis.asyncio.Redis` get/set/delete methods
+    works, so it can be tested against a local stand-in.
+    """
+
+    def __init__(self, client, ttl: float = 1500, prefix: str = "novagent:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, session_id: str) -> dict | None:
+        data = await self.client.get(self.prefix + session_id)
+        return await asyncio.to_thread(json.loads, data) if data is not None else None
+
+    async def version(self, session_id: str) -> int | None:
+        # kept apart so checking a cached session does not load the state.
+        data = await self.client.get(self.prefix + session_id + ":version")
+        return int(data) if data is not None else None
+
+    async def set(self, session_id: str, state: dict):
+        # Redis expiries are whole seconds, at least one.
+        ex = max(1, math.ceil(self.ttl))
+        data = await asyncio.to_thread(json.dumps, state)
+        await self.client.set(self.prefix + session_id, data, ex=ex)
+        await self.client.set(
+            self.prefix + session_id + ":version", state.get("version", 0), ex=ex
+        )
+
+    async def delete(self, session_id: str):
+        await self.client.delete(
+            self.prefix + session_id, self.prefix + session_id + ":version"
+        )
@@ -0,0 +1,276 @@
+import copy
+import asyncio
+import inspect
+import threading
+from collections import deque
+from typing import Callable
+from cachetools import LRUCache, TTLCache
+
+
+class Tool:
+    """
+    A python function the agent code can call, sync or async.
+
+    The signature and the docstring of the function are shown to the model,
+    so annotate the arguments and document what the tool returns.
+
+    The results can be memoized, keyed on the arguments once bound to the
+    signature: `f(1)` and `f(x=1)` share an entry. Calls with unhashable
+    arguments and results which can not be copied are not cached. A cached
+    result is copied for every caller so mutating it does not alter the
+    cache. A tool is shared by the sessions of a config, and so is its cache.
+
+    Args:
+        function (Callable): The function, its name is the one of the tool
+        cache_size (int): Maximum number of cached results, least recently used
+            evicted first (default: no cache, 1024 with a TTL)
+        cache_ttl (float): Seconds a result stays cached (default: forever)
+        max_concurrent (int): Maximum number of concurrent calls (default: unlimited)
+        name (str): Name of the tool in the agent code (default: the function one)
+    """
+
+    DEFAULT_CACHE_SIZE = 1024
+
+    def __init__(
+        self,
+        function: Callable,
+        cache_size: int | None = None,
+        cache_ttl: float | None = None,
+        max_concurrent: int | None = None,
+        name: str | None = None,
+    ):
+        self.function = function
+        self.name = name or function.__name__
+        self.signature = inspect.signature(function)
+        self.is_async = inspect.iscoroutinefunction(function)
+
+        self.cache = None
+        self.lock = threading.Lock()
+
+        if cache_size or cache_ttl:
+            maxsize = cache_size or Tool.DEFAULT_CACHE_SIZE
+            self.cache = (
+                TTLCache(maxsize=maxsize, ttl=cache_ttl)
+                if cache_ttl
+                else LRUCache(maxsize=maxsize)
+            )
+
+        self.limiter = _Limiter(max_concurrent) if max_concurrent else None
+
+    def __call__(self, *args, **kwargs):
+        if self.is_async:
+            return self._acall(args, kwargs)
+
+        return self._call(args, kwargs)
+
+    def describe(self) -> str:
+        """The definition of the tool as shown in the system prompt."""
+        prefix = "async def" if self.is_async else "def"
+        description = f"{prefix} {self.name}{self.signature}:"
+        doc = inspect.getdoc(self.function)
+
+        if not doc:
+            return f"{description} ..."
+
+        body = "\n".join(f"    {line}" if line else "" for line in doc.split("\n"))
+
+        return f'{description}\n    """\n{body}\n    """'
+
+    def _call(self, args: tuple, kwargs: dict):
+        key = self._key(args, kwargs)
+        hit, value = self._lookup(key)
+
+        if hit:
+            return value
+
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+        try:
+            # the result may have been cached while waiting for a slot.
+            hit, value = self._lookup(key)
+
+            if not hit:
+                value = self.function(*args, **kwargs)
+                self._store(key, value)
+        finally:
+            if self.limiter is not None:
+                self.limiter.release()
+
+        return value
+
+    async def _acall(self, args: tuple, kwargs: dict):
+        key = self._key(args, kwargs)
+        hit, value = self._lookup(key)
+
+        if hit:
+            return value
+
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+
+        try:
+            hit, value = self._lookup(key)
+
+            if not hit:
+                value = await self.function(*args, **kwargs)
+                self._store(key, value)
+        finally:
+            if self.limiter is not None:
+                self.limiter.release()
+
+        return value
+
+    def _key(self, args: tuple, kwargs: dict) -> tuple | None:
+        if self.cache is None:
+            return None
+
+        # invalid arguments are left for the function to report.
+        try:
+            bound = self.signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+
+        bound.apply_defaults()
+        key = (bound.args, tuple(sorted(bound.kwargs.items())))
+
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def _lookup(self, key: tuple | None) -> tuple[bool, object]:
+        if key is None:
+            return False, None
+
+        with self.lock:
+            try:
+                value = self.cache[key]
+            except KeyError:
+                return False, None
+
+        return True, copy.deepcopy(value)
+
+    def _store(self, key: tuple | None, value):
+        if key is None:
+            return
+
+        # the caller gets the value itself, the cache keeps a copy.
+        try:
+            value = copy.deepcopy(value)
+        except Exception:
+            return
+
+        with self.lock:
+            self.cache[key] = value
+
+
+def tool(
+    function: Callable | None = None,
+    *,
+    cache_size: int | None = None,
+    cache_ttl: float | None = None,
+    max_concurrent: int | None = None,
+    name: str | None = None,
+):
+    """Decorator making a Tool of a function, with or without options."""
+
+    def wrap(function: Callable) -> Tool:
+        return Tool(function, cache_size, cache_ttl, max_concurrent, name)
+
+    return wrap(function) if function is not None else wrap
+
+
+class _Limiter:
+    """
+    A semaphore shared by threads and event loops.
+
+    The agent code of the sessions runs in the executor threads and on the
+    loops of their contexts, so asyncio and threading semaphores would only
+    limit some of the calls. Waiters are served in order.
+    """
+
+    # the waiting threads wake up this often so they can be interrupted.
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, value: int):
+        self.value = value
+        self.lock = threading.Lock()
+        self.waiters = deque()
+
+    def acquire(self):
+        with self.lock:
+            if self.value > 0 and not self.waiters:
+                self.value -= 1
+                return
+
+            waiter = _Waiter(threading.Event())
+            self.waiters.append(waiter)
+
+        try:
+            while not waiter.event.wait(self.POLL_INTERVAL):
+                pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    async def acquire_async(self):
+        with self.lock:
+            if self.value > 0 and not self.waiters:
+                self.value -= 1
+                return
+
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop.create_future(), loop)
+            self.waiters.append(waiter)
+
+        try:
+            await waiter.event
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def release(self):
+        with self.lock:
+            while self.waiters:
+                waiter = self.waiters.popleft()
+
+                if waiter.wake():
+                    return
+
+            self.value += 1
+
+    def _abandon(self, waiter: "_Waiter"):
+        """A waiter left, give back its slot if it had been handed one."""
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                return
+
+        self.release()
+
+
+class _Waiter:
+    def __init__(self, event, loop: asyncio.AbstractEventLoop | None = None):
+        self.event = event  # a threading.Event, or a future of the loop
+        self.loop = loop
+
+    def wake(self) -> bool:
+        """Hand the slot to the waiter, return whether it could be woken."""
+        if self.loop is None:
+            self.event.set()
+            return True
+
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+        except RuntimeError:
+            # the loop is closed, its waiter is gone.
+            return False
+
+        return True
+
+    def _resolve(self):
+        if not self.event.done():
+            self.event.set_result(None)